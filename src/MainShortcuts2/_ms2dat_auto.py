@@ -1,7 +1,10 @@
+import builtins
 import typing
 from . import ms2dat1
+from . import ms2dat2
+from .ms2dat_log import RecordLog
 from io import BytesIO
-# Использовать последнюю версию для сохранения
+# Сохранение в v1: у словарей из мелких записей v2 заметно больше (таблица ключей, словари кадров). v2 - через `ms2dat2`
 dump = ms2dat1.dump
 dumps = ms2dat1.dumps
 write_file = ms2dat1.write_file
@@ -13,6 +16,8 @@ def load(file: typing.BinaryIO, **kw):
   header = ms2dat1.FileHeader.from_file(file)
   if header.version == 1:
     return ms2dat1.load(file, _h=header, **kw)
+  if header.version == 2:
+    return ms2dat2.load(file, _h=header, **kw)
   raise Exception(f"Unsupported version {header.version}")
 
 
@@ -22,7 +27,22 @@ def loads(data: bytes, **kw):
     return load(f, **kw)
 
 
+def _read_version(path) -> int:
+  with builtins.open(path, "rb") as f:
+    return ms2dat1.FileHeader.from_file(f).version
+
+
 def read_file(path, **kw):
   """Загрузить объект из локального файла"""
-  with open(path, "rb") as f:
+  if _read_version(path) == 2:
+    return ms2dat2.read_file(path, **kw)
+  with builtins.open(path, "rb") as f:
     return load(f, **kw)
+
+
+def open(path, **kw):
+  """Открыть локальный файл для загрузки по частям (`LazyDict`/`LazyList` для v2). Файлы v1 загружаются целиком"""
+  if _read_version(path) == 2:
+    return ms2dat2.open_file(path, **kw)
+  kw.pop("cache", None)
+  return read_file(path, **kw)
@@ -0,0 +1,162 @@
+"""Замер стоимости ленивой загрузки подмодулей (`ms.<атрибут>`) и импортов внутри пакета.
+Модуль импортируется только при включении замеров, поэтому тяжёлые импорты выполняются в `StartupProfiler.enable`"""
+import sys
+from functools import cached_property
+from time import perf_counter
+PACKAGE = __name__.rpartition(".")[0]
+ENV_NAME = "MS2_PROFILE_STARTUP"
+
+
+class Record:
+  """Одна загрузка: атрибут `ms` или импорт модуля"""
+
+  def __init__(self, kind: str, name: str, depth: int):
+    self.depth = depth
+    self.elapsed: float = 0.0
+    self.kind = kind
+    self.name = name
+    self.new_modules: list[str] = []
+
+  def to_dict(self):
+    return {
+        "depth": self.depth,
+        "elapsed_ms": round(self.elapsed * 1000, 3),
+        "kind": self.kind,
+        "name": self.name,
+        "new_modules": self.new_modules,
+    }
+
+
+class StartupReport:
+  """Отчёт о загрузке. Доступен в виде таблицы (`str()`) и JSON"""
+
+  def __init__(self, records: list[Record], enabled_at: float, modules_at_start: int):
+    self.enabled_at = enabled_at
+    self.modules_at_start = modules_at_start
+    self.records = list(records)
+
+  def __str__(self):
+    return self.to_table()
+
+  def to_dict(self):
+    return {
+        "modules_at_start": self.modules_at_start,
+        "modules_now": len(sys.modules),
+        "records": [i.to_dict() for i in self.records],
+        "total_ms": round(sum(i.elapsed for i in self.records if i.depth == 0) * 1000, 3),
+    }
+
+  def to_json(self, **kw) -> str:
+    import json
+    return json.dumps(self.to_dict(), **kw)
+
+  def to_table(self) -> str:
+    rows = [("KIND", "NAME", "TIME, ms", "NEW MODULES")]
+    for i in self.records:
+      rows.append((i.kind, "  " * i.depth + i.name, "%.3f" % (i.elapsed * 1000), str(len(i.new_modules))))
+    widths = [max(len(r[n]) for r in rows) for n in range(4)]
+    lines = []
+    for r in rows:
+      lines.append("  ".join([r[0].ljust(widths[0]), r[1].ljust(widths[1]), r[2].rjust(widths[2]), r[3].rjust(widths[3])]))
+    data = self.to_dict()
+    lines.append("Total: %.3f ms, modules: %i -> %i" % (data["total_ms"], data["modules_at_start"], data["modules_now"]))
+    return "\n".join(lines)
+
+
+class _TimedLoader:
+  """Обёртка над загрузчиком модуля, замеряющая `exec_module`"""
+
+  def __init__(self, profiler: "StartupProfiler", loader):
+    self._loader = loader
+    self._profiler = profiler
+
+  def __getattr__(self, k):
+    return getattr(self._loader, k)
+
+  def create_module(self, spec):
+    return self._loader.create_module(spec)
+
+  def exec_module(self, module):
+    with self._profiler.measure("import", module.__name__):
+      self._loader.exec_module(module)
+
+
+class _Finder:
+  """Поисковик для `sys.meta_path`, оборачивающий загрузчики модулей пакета"""
+
+  def __init__(self, profiler: "StartupProfiler"):
+    self.profiler = profiler
+
+  def find_spec(self, fullname, path, target=None):
+    if not fullname.startswith(PACKAGE + "."):
+      return None
+    from importlib.machinery import PathFinder
+    spec = PathFinder.find_spec(fullname, path, target)
+    if spec is not None and spec.loader is not None:
+      spec.loader = _TimedLoader(self.profiler, spec.loader)
+    return spec
+
+
+class StartupProfiler:
+  def __init__(self):
+    self._local = None
+    self._lock = None
+    self.enabled = False
+    self.enabled_at = 0.0
+    self.finder = _Finder(self)
+    self.modules_at_start = 0
+    self.records: list[Record] = []
+
+  def measure(self, kind: str, name: str):
+    return _Measure(self, kind, name)
+
+  def enable(self, ms_cls: type):
+    """Включить замеры для атрибутов класса `MS2` и импортов внутри пакета"""
+    if self.enabled:
+      return
+    import threading
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self.enabled = True
+    self.enabled_at = perf_counter()
+    self.modules_at_start = len(sys.modules)
+    sys.meta_path.insert(0, self.finder)
+    for name, prop in list(vars(ms_cls).items()):
+      if isinstance(prop, cached_property):
+        prop.func = self._wrap_attr(name, prop.func)
+
+  def _wrap_attr(self, name: str, func):
+    def wrapper(instance):
+      with self.measure("attr", "ms." + name):
+        return func(instance)
+    wrapper.__doc__ = func.__doc__
+    wrapper.__wrapped__ = func
+    return wrapper
+
+  def report(self):
+    if self._lock is None:  # Замеры не включены
+      return StartupReport([], self.enabled_at, self.modules_at_start)
+    with self._lock:
+      return StartupReport(self.records, self.enabled_at, self.modules_at_start)
+
+
+class _Measure:
+  def __init__(self, profiler: StartupProfiler, kind: str, name: str):
+    self.profiler = profiler
+    self.record = Record(kind, name, getattr(profiler._local, "depth", 0))
+
+  def __enter__(self):
+    self.profiler._local.depth = self.record.depth + 1
+    with self.profiler._lock:
+      self.profiler.records.append(self.record)
+    self._modules = set(sys.modules)
+    self._started = perf_counter()
+    return self.record
+
+  def __exit__(self, *a):
+    self.record.elapsed = perf_counter() - self._started
+    self.record.new_modules = sorted(set(sys.modules) - self._modules)
+    self.profiler._local.depth = self.record.depth
+
+
+profiler = StartupProfiler()
@@ -3,12 +3,13 @@ import os
 import re
 import subprocess
 import sys
+import time
 from .core import ms
 from .path import Path
 from .utils import sleep
 from functools import cached_property
 from threading import Thread
-from typing import IO, Any, Union
+from typing import IO, Any, AsyncIterator, Iterable, Union
 
 
 def _check_count(data):
@@ -402,8 +403,160 @@ class CodeModule:
     self.__dict__["globals"][k] = v
 
 
-class FileDownloader(ms.ObjectBase):
-  """Функциональное скачивание данных по HTTP"""
+def _raise_failed(futures):
+  for i in futures:
+    if i.done() and i.exception() is not None:
+      raise i.exception()
+
+
+def _clone_file(src: str, dst: str):
+  """Копировать содержимое файла через `os.copy_file_range` (без передачи данных через Python, на некоторых ФС без копирования блоков), иначе через `shutil.copyfile`"""
+  import shutil
+  if hasattr(os, "copy_file_range"):
+    try:
+      with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        left = os.fstat(fsrc.fileno()).st_size
+        while left > 0:
+          copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), left)
+          if not copied:
+            break
+          left -= copied
+      return
+    except OSError:  # Другая ФС на старом ядре, не поддерживается ФС и т.п.
+      pass
+  shutil.copyfile(src, dst)
+
+
+class DownloadCache(ms.ObjectBase):
+  """Кэш скачанных файлов на диске. Вместе с файлом сохраняются `ETag` и `Last-Modified`, при повторном скачивании отправляется условный запрос
+  (`If-None-Match`/`If-Modified-Since`), и при ответе 304 файл берётся из кэша. Файлы без `ETag` и `Last-Modified` не кэшируются.
+  Содержимое хранится в папке `dir`, индекс - в SQLite (`ms.sql.sqlite.Database`). При превышении `max_size` удаляются давно не использованные файлы.
+  При `link=True` файлы кэша и скачанные файлы - жёсткие ссылки (изменение скачанного файла на месте испортит кэш), иначе они копируются.
+  `hits` - сколько раз файл взят из кэша, `misses` - сколько раз он скачан и сохранён заново"""
+  INDEX_NAME = "index.db"
+  TABLE = "entries"
+  SCHEMA = {TABLE: {"url": "TEXT", "name": "TEXT", "etag": "TEXT", "last_modified": "TEXT", "size": "INTEGER", "used_at": "REAL"}}
+
+  def __init__(self, dir: str, max_size: int = 2**30, link: bool = False, **kw):
+    import threading
+    from MainShortcuts2.sql.sqlite import Database
+    kw["schema"] = self.SCHEMA
+    self._lock = threading.Lock()
+    self.dir = ms.path.path2str(dir, True)
+    self.db = Database(os.path.join(self.dir, self.INDEX_NAME), **kw)
+    self.db.exec(f"CREATE UNIQUE INDEX IF NOT EXISTS {self.TABLE}_url ON {self.TABLE} (url)", fetch=False)
+    self.hits = 0
+    self.link = link
+    self.max_size = max_size
+    self.misses = 0
+
+  def __repr__(self):
+    return ms.ObjectBase.__repr__(self, repr(self.dir))
+
+  @property
+  def stats(self) -> dict[str, int]:
+    return {"hits": self.hits, "misses": self.misses}
+
+  def _place(self, src: str, dst: str):
+    if os.path.lexists(dst):
+      os.remove(dst)
+    if self.link:
+      try:
+        return os.link(src, dst)
+      except OSError:  # Разные ФС или ФС без жёстких ссылок
+        pass
+    _clone_file(src, dst)
+
+  def _forget(self, url: str, name: str = None):
+    self.db.exec(f"DELETE FROM {self.TABLE} WHERE url=?", (url,), fetch=False)
+    if name is not None:
+      try:
+        os.remove(os.path.join(self.dir, name))
+      except FileNotFoundError:
+        pass
+
+  def lookup(self, url: str) -> dict | None:
+    """Запись кэша для URL: путь к файлу (`path`), размер (`size`) и заголовки для условного запроса (`headers`)"""
+    with self._lock:
+      rows = self.db.exec(f"SELECT name, etag, last_modified, size FROM {self.TABLE} WHERE url=?", (url,))
+      if not rows:
+        return None
+      name, etag, last_modified, size = rows[0]
+      path = os.path.join(self.dir, name)
+      try:
+        if os.path.getsize(path) != size:
+          raise FileNotFoundError(path)
+      except FileNotFoundError:
+        self._forget(url, name)
+        return None
+    headers = {}
+    if etag:
+      headers["If-None-Match"] = etag
+    if last_modified:
+      headers["If-Modified-Since"] = last_modified
+    return {"headers": headers, "path": path, "size": size}
+
+  def restore(self, url: str, path: str) -> int | None:
+    """Положить файл из кэша в `path` (после ответа 304). Возвращает размер или `None`, если файла в кэше уже нет"""
+    entry = self.lookup(url)
+    if entry is None:
+      return None
+    path = ms.path.path2str(path)
+    tmp_path = path + ".ms2downloading"
+    try:
+      self._place(entry["path"], tmp_path)
+    except FileNotFoundError:  # Удалён из кэша другим потоком
+      return None
+    os.replace(tmp_path, path)
+    with self._lock:
+      self.db.exec(f"UPDATE {self.TABLE} SET used_at=? WHERE url=?", (time.time(), url), fetch=False)
+      self.hits += 1
+    return entry["size"]
+
+  def store(self, url: str, path: str, headers) -> bool:
+    """Сохранить скачанный файл в кэш, если в заголовках ответа есть `ETag` или `Last-Modified`"""
+    import hashlib
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if not (etag or last_modified):
+      return False
+    path = ms.path.path2str(path)
+    size = os.path.getsize(path)
+    if size > self.max_size:
+      return False
+    name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    tmp_path = os.path.join(self.dir, "%s.%s.tmp" % (name, ms.utils.randstr(8)))
+    self._place(path, tmp_path)
+    os.replace(tmp_path, os.path.join(self.dir, name))
+    with self._lock:
+      self.db.exec(f"INSERT OR REPLACE INTO {self.TABLE} (url, name, etag, last_modified, size, used_at) VALUES (?, ?, ?, ?, ?, ?)", (url, name, etag, last_modified, size, time.time()), fetch=False)
+      self.misses += 1
+      self._evict()
+    return True
+
+  def _evict(self):
+    total = self.db.exec(f"SELECT COALESCE(SUM(size), 0) FROM {self.TABLE}")[0][0]
+    if total <= self.max_size:
+      return
+    for url, name, size in self.db.exec(f"SELECT url, name, size FROM {self.TABLE} ORDER BY used_at"):
+      if total <= self.max_size:
+        break
+      self._forget(url, name)
+      total -= size
+
+  def clear(self):
+    """Удалить все файлы из кэша"""
+    with self._lock:
+      for url, name in self.db.exec(f"SELECT url, name FROM {self.TABLE}"):
+        self._forget(url, name)
+
+  def close(self):
+    with self._lock:
+      self.db.close()
+
+
+class _DownloaderBase(ms.ObjectBase):
+  """События и обработчики, общие для `FileDownloader` и `AsyncFileDownloader`"""
   EVENT_STARTING = 0
   """Перед отправкой запроса"""
   EVENT_STARTED = 1
@@ -416,19 +569,23 @@ class FileDownloader(ms.ObjectBase):
   """Завершено с ошибкой"""
   EVENT_END = 5
   """Завершено (в любом случае)"""
-  EVENT_NAMES = {0: "STARTING", 1: "STARTED", 2: "DOWNLOADING", 3: "COMPLETE", 4: "ERROR", 5: "END"}
+  EVENT_CHUNK = 6
+  """Каждый чанк данных по порядку, без ограничения частоты. Обработчики получают только `chunk` и `data`"""
+  EVENT_NAMES = {0: "STARTING", 1: "STARTED", 2: "DOWNLOADING", 3: "COMPLETE", 4: "ERROR", 5: "END", 6: "CHUNK"}
+  ADAPTIVE_TARGET_TIME = 0.01
+  adaptive_chunk_size = False
+  """Увеличивать чанк до `max_chunk_size`, пока чтение чанка занимает меньше `ADAPTIVE_TARGET_TIME`, и уменьшать до `chunk_size` при медленном соединении"""
+  max_chunk_size = 2**20  # 1 MB
+  progress_interval = 0.0
+  """`EVENT_DOWNLOADING` не чаще раза в N секунд (0 - без ограничения)"""
+  progress_size = 0
+  """`EVENT_DOWNLOADING` не чаще раза в N байт (0 - без ограничения). Если заданы оба ограничения, событие будет при выполнении любого"""
 
   class CancelError(BaseException):
-    pass
-
-  def __init__(self, *, log=ms.log, **req_kw):
-    import requests
-    self.chunk_size = 16384  # 16 KB
-    self.handlers: dict[int, list] = {}
-    self.log = log
-    self.req_kw = req_kw
-    if not "session" in self.req_kw:
-      self.req_kw["session"] = requests.Session()
+    """Исключение для обработчиков: прерывает скачивание. После `EVENT_ERROR` и `EVENT_END` выбрасывается из метода `download2*`"""
+  chunk_size: int
+  handlers: dict[int, list]
+  req_kw: dict
 
   def _run_handlers(self, event: int, data: dict):
     if not data["enable_handlers"]:
@@ -439,11 +596,48 @@ class FileDownloader(ms.ObjectBase):
         func(**data)
       except self.CancelError:
         self.log.error("Handler %s canceled downloading on event %s", func, self.EVENT_NAMES.get(event, event))
+        raise
       except Exception as exc:
         self.log.exception("Exception in handler %s on event %r", func, self.EVENT_NAMES.get(event, event), exc_info=exc)
     if event in {self.EVENT_COMPLETE, self.EVENT_ERROR}:
       self._run_handlers(self.EVENT_END, data)
 
+  def _on_chunk(self, data: dict, chunk: bytes):
+    data["chunk_count"] += 1
+    data["chunk"] = chunk
+    if not data["enable_handlers"]:
+      return
+    for func in self.handlers.get(self.EVENT_CHUNK, ()):
+      try:
+        func(chunk=chunk, data=data)
+      except self.CancelError:
+        self.log.error("Handler %s canceled downloading on event %s", func, self.EVENT_NAMES[self.EVENT_CHUNK])
+        raise
+      except Exception as exc:
+        self.log.exception("Exception in handler %s on event %r", func, self.EVENT_NAMES[self.EVENT_CHUNK], exc_info=exc)
+
+  def _on_progress(self, data: dict, final: bool = False):
+    """`EVENT_DOWNLOADING` с учётом `progress_interval` и `progress_size`. `final` - последнее событие, если прогресс ещё не был передан"""
+    downloaded = data["downloaded"]
+    reported = data.get("reported_size", 0)
+    now = time.monotonic()
+    if final:
+      if downloaded == reported:
+        return
+    elif self.progress_interval or self.progress_size:
+      if not (self.progress_size and downloaded - reported >= self.progress_size) and not (self.progress_interval and now - data.get("reported_at", 0) >= self.progress_interval):
+        return
+    data["reported_at"] = now
+    data["reported_size"] = downloaded
+    self._run_handlers(self.EVENT_DOWNLOADING, data)
+
+  def _next_chunk_size(self, size: int, got: int, elapsed: float) -> int:
+    if got >= size and elapsed < self.ADAPTIVE_TARGET_TIME / 2:
+      return min(size * 2, self.max_chunk_size)
+    if elapsed > self.ADAPTIVE_TARGET_TIME * 2:
+      return max(size // 2, self.chunk_size)
+    return size
+
   def add_handler(self, event: int):
     """Добавить обработчик евента"""
     self.handlers.setdefault(event, [])
@@ -456,20 +650,163 @@ class FileDownloader(ms.ObjectBase):
       return func
     return deco
 
+  def _merge_req_kw(self, kw: dict):
+    for k, v in self.req_kw.items():
+      if k in {"headers", "params"}:
+        if not v is None:
+          kw.setdefault(k, {})
+          for k2, v2 in v.items():
+            kw[k].setdefault(k2, v2)
+      else:
+        kw.setdefault(k, v)
+
+  def h_limit_size(self, max_size: int):
+    @self.add_handler(self.EVENT_STARTED)
+    def h_limit_size_start(total_size: None | int, **kw):
+      if total_size:
+        if total_size > max_size:
+          raise self.CancelError()
+
+    @self.add_handler(self.EVENT_DOWNLOADING)
+    def h_limit_size_progress(downloaded: int, **kw):
+      if downloaded > max_size:
+        raise self.CancelError()
+
+  def h_hash(self, hash_name: str, data_name: str = None, **hash_kw):
+    import hashlib
+    hash_type: type[hashlib._Hash] = getattr(hashlib, hash_name.lower())
+    if data_name is None:
+      data_name = hash_name
+    data_name_h = data_name + "_h"
+
+    @self.add_handler(self.EVENT_STARTED)
+    def h_hash_start(data: dict, **kw):
+      data[data_name_h] = hash_type(**hash_kw)
+
+    @self.add_handler(self.EVENT_CHUNK)
+    def h_hash_update(chunk: bytes, data: dict, **kw):
+      data[data_name_h].update(chunk)
+
+    @self.add_handler(self.EVENT_COMPLETE)
+    def h_hash_complete(data: dict, **kw):
+      digest = kw[data_name_h].digest()
+      data[data_name] = digest.hex()
+      data[data_name + "_b"] = digest
+    return data_name
+
+  def h_progressbar(self, data_name="h_progressbar", **pbar_kw):
+    import progressbar
+    pbar_kw.setdefault("min_poll_interval", 0.5)
+
+    @self.add_handler(self.EVENT_STARTED)
+    def h_pbar_start(total_size: None | int, data: dict, **kw):
+      data[data_name] = progressbar.ProgressBar(**pbar_kw).start(total_size)
+
+    @self.add_handler(self.EVENT_DOWNLOADING)
+    def h_pbar_update(downloaded: int, **kw):
+      kw[data_name].update(downloaded)
+
+    @self.add_handler(self.EVENT_END)
+    def h_pbar_complete(errored: bool, **kw):
+      kw[data_name].finish(dirty=errored)
+    return data_name
+
+
+class FileDownloader(_DownloaderBase):
+  """Функциональное скачивание данных по HTTP"""
+  CHECKPOINT_SUFFIX = ".ms2downloading.json"
+  MIN_SEGMENT_SIZE = 2**20  # 1 MB
+  SEGMENTS_PER_CONNECTION = 4
+
+  def __init__(self, *, log=ms.log, **req_kw):
+    import requests
+    self.cache: DownloadCache | None = None
+    """Кэш для `download2file` по умолчанию"""
+    self.chunk_size = 16384  # 16 KB
+    self.handlers: dict[int, list] = {}
+    self.log = log
+    self.req_kw = req_kw
+    if not "session" in self.req_kw:
+      self.req_kw["session"] = requests.Session()
+
+  def _iter_content(self, resp) -> Iterable[bytes]:
+    if not self.adaptive_chunk_size:
+      yield from resp.iter_content(self.chunk_size)
+      return
+    read = resp.raw.read
+    size = self.chunk_size
+    while True:
+      started = time.perf_counter()
+      chunk = read(size, decode_content=True)
+      if not chunk:
+        break
+      size = self._next_chunk_size(size, len(chunk), time.perf_counter() - started)
+      yield chunk
+
+  def _iter_file(self, path: str) -> Iterable[bytes]:
+    with open(path, "rb") as f:
+      while True:
+        chunk = f.read(max(self.chunk_size, 2**20))
+        if not chunk:
+          break
+        yield chunk
+
   def _check_resume_support(self, data=None, func=None, io=None, **kw):
     return ms.utils.http_check_range_support(**kw)
 
-  def download2file(self, url: str, path: str, *, resume: bool = False, **kw):
-    """Скачать данные в файл"""
+  def download2file(self, url: str, path: str, *, cache: DownloadCache | None = None, connections: int = 1, resume: bool = False, **kw):
+    """Скачать данные в файл. При `connections` > 1 и поддержке `Range` сервером файл скачивается частями в несколько соединений,
+    а прогресс сохраняется в файл `CHECKPOINT_SUFFIX`, чтобы при `resume=True` продолжить прерванное скачивание.
+    `cache` - `DownloadCache` (по умолчанию `self.cache`): если файл есть в кэше, он скачивается условным запросом в одно соединение,
+    и при ответе 304 берётся из кэша (`data["cached"]` будет `True`)"""
     real_path = ms.path.path2str(path)
     kw.setdefault("data", {})
     kw["data"]["real_path"] = real_path
     kw["url"] = url
+    if cache is None:
+      cache = self.cache
+    if cache is None:
+      return self._download2file(real_path, connections=connections, resume=resume, **kw)
+    kw["data"]["cached"] = False
+    entry = cache.lookup(url)
+    if entry is None:
+      data = self._download2file(real_path, connections=connections, resume=resume, **kw)
+    else:
+      req_kw = dict(kw)
+      req_kw["headers"] = dict(kw.get("headers") or {})
+      req_kw["headers"].update(entry["headers"])
+      data = kw["data"]
+      data["cache_path"] = entry["path"]
+      data["tmp_path"] = real_path + ".ms2downloading"
+      with open(data["tmp_path"], "wb") as f:
+        self.download2io(io=f, **req_kw)
+      if data["resp"].status_code != 304:
+        ms.file.move(data["tmp_path"], real_path)
+      else:
+        os.remove(data["tmp_path"])
+        data["cached"] = True
+        if cache.restore(url, real_path) is not None:
+          return data
+        del data["cache_path"]  # Файл удалён из кэша, пока шёл запрос
+        data["cached"] = False
+        data = self._download2file(real_path, **kw)
+    resp = data.get("resp")
+    cache.store(url, real_path, data.get("probe_headers", {}) if resp is None else resp.headers)
+    return data
+
+  def _download2file(self, path: str, *, connections: int = 1, resume: bool = False, **kw):
+    real_path = path
+    if connections > 1:
+      probe = self._probe_segmented(**kw)
+      if probe is not None:
+        kw["connections"] = connections
+        kw["path"] = real_path
+        kw["resume"] = resume
+        kw["total_size"], kw["validator"] = probe
+        return self._download_segmented(**kw)
     if resume and os.path.exists(real_path):
       if not self._check_resume_support(**kw):
-        kw["path"] = real_path
-        kw["resume"] = False
-        return self.download2file(**kw)
+        return self._download2file(real_path, **kw)
       kw.setdefault("headers", {})
       kw["headers"]["Range"] = "bytes=%s-" % os.path.getsize(real_path)
       with open(real_path, "ab") as f:
@@ -497,16 +834,205 @@ class FileDownloader(ms.ObjectBase):
     kw["url"] = url
     return self.download2func(**kw)
 
+  def _probe_segmented(self, url: str, data=None, enable_handlers=None, **kw) -> tuple[int, str | None] | None:
+    """Размер файла и его версия (`ETag` или `Last-Modified`), если сервер отдаёт его частями"""
+    kw = dict(kw)
+    self._merge_req_kw(kw)
+    kw["headers"] = dict(kw.get("headers") or {})
+    kw["headers"]["Range"] = "bytes=0-0"
+    kw["ignore_status"] = True  # Для пустого файла сервер может ответить 416
+    kw["method"] = "GET"
+    kw["stream"] = True
+    kw["url"] = url
+    with ms.utils.sync_request(**kw) as resp:
+      if resp.status_code != 206:
+        return None
+      total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+      if not total.isdigit():
+        return None
+      if data is not None:
+        data["probe_headers"] = resp.headers
+      return int(total), resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+
+  @staticmethod
+  def _segment_session(session, connections: int):
+    """Отдельная сессия для потоков частей с пулом на `connections` соединений. Настройки и повторы берутся из `session`, сама она не меняется"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    result = requests.Session()
+    if session is not None:
+      for k in ("auth", "cert", "max_redirects", "params", "proxies", "trust_env", "verify"):
+        setattr(result, k, getattr(session, k))
+      result.cookies = session.cookies.copy()
+      result.headers = session.headers.copy()
+      result.hooks = {k: list(v) for k, v in session.hooks.items()}
+    for prefix in ("http://", "https://"):
+      adapter = None if session is None else session.adapters.get(prefix)
+      result.mount(prefix, HTTPAdapter(pool_connections=connections, pool_maxsize=connections, max_retries=getattr(adapter, "max_retries", 0)))
+    return result
+
+  def _download_segmented(self, url: str, path: str, *, connections: int, resume: bool, total_size: int, validator: str | None, data: dict = None, enable_handlers: bool = True, **kw):
+    import queue
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    self._merge_req_kw(kw)
+    kw.setdefault("method", "GET")
+    kw["stream"] = True
+    kw["url"] = url
+    tmp_path = path + ".ms2downloading"
+    checkpoint_path = path + self.CHECKPOINT_SUFFIX
+    segments = None  # [начало, конец, скачано]
+    if resume and os.path.isfile(tmp_path) and os.path.isfile(checkpoint_path):
+      try:
+        checkpoint = ms.json.read(checkpoint_path)
+        if [checkpoint["url"], checkpoint["size"], checkpoint["validator"]] == [url, total_size, validator]:
+          segments = checkpoint["segments"]
+      except Exception as exc:
+        self.log.warning("Ignoring broken download checkpoint %s: %s", checkpoint_path, exc)
+    if segments is None:
+      count = max(1, min(connections * self.SEGMENTS_PER_CONNECTION, total_size // self.MIN_SEGMENT_SIZE))
+      step = -(-total_size // count) if total_size else 0
+      segments = [[i, min(i + step, total_size), 0] for i in range(0, total_size, step or 1)]
+      with open(tmp_path, "wb") as f:
+        if total_size and hasattr(os, "posix_fallocate"):
+          try:
+            os.posix_fallocate(f.fileno(), 0, total_size)
+          except OSError:
+            f.truncate(total_size)
+        else:
+          f.truncate(total_size)
+
+    def save_checkpoint():
+      ms.json.write(checkpoint_path, {"segments": segments, "size": total_size, "url": url, "validator": validator})
+    save_checkpoint()
+    if data is None:
+      data = {}
+    data["chunk"] = b""
+    data["chunk_count"] = 0
+    data["connections"] = connections
+    data["data"] = data
+    data["downloaded"] = sum(i[2] for i in segments)
+    data["downloader"] = self
+    data["enable_handlers"] = enable_handlers
+    data["errored"] = False
+    data["func"] = None
+    data["req_kw"] = kw
+    data["segments"] = segments
+    data["started_at"] = ms.now
+    data["tmp_path"] = tmp_path
+    data["total_size"] = total_size
+    data["url"] = url
+    progress = queue.Queue()
+    stop = threading.Event()
+    need_chunks = enable_handlers and bool(self.handlers.get(self.EVENT_CHUNK))
+
+    def fetch(index: int):
+      start, end, done = segments[index]
+      if stop.is_set() or start + done >= end:
+        return
+      req_kw = dict(kw)
+      req_kw["session"] = session
+      req_kw["headers"] = dict(kw.get("headers") or {})
+      req_kw["headers"]["Range"] = "bytes=%i-%i" % (start + done, end - 1)
+      fd = os.open(tmp_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+      try:
+        pos = start + done
+        with ms.utils.sync_request(**req_kw) as resp:
+          if resp.status_code != 206:
+            raise ValueError("Server ignored Range request (status %s)" % resp.status_code)
+          for chunk in self._iter_content(resp):
+            if stop.is_set():
+              return
+            chunk = chunk[:end - pos]
+            view = memoryview(chunk)
+            while view:
+              if hasattr(os, "pwrite"):
+                written = os.pwrite(fd, view, pos)
+              else:
+                os.lseek(fd, pos, os.SEEK_SET)
+                written = os.write(fd, view)
+              view = view[written:]
+              pos += written
+            progress.put((index, len(chunk)))
+            if pos >= end:
+              break
+        if pos < end:
+          raise ValueError("Segment %i-%i was not fully downloaded" % (start, end - 1))
+      finally:
+        os.close(fd)
+    session = self._segment_session(kw.get("session"), connections)
+    self._run_handlers(self.EVENT_STARTING, data)
+    try:
+      # Без буфера: буфер чтения мог бы сохранить байты, которые потом перезапишут потоки
+      with open(tmp_path, "rb", buffering=0) as reader, ThreadPoolExecutor(connections) as pool:
+        data["connected_at"] = ms.now
+        self._run_handlers(self.EVENT_STARTED, data)
+        futures = [pool.submit(fetch, i) for i in range(len(segments))]
+        ordered = 0  # Сколько байт с начала файла уже передано обработчикам по порядку
+        front = 0  # Первая недокачанная часть
+
+        def report():
+          # Обработчики EVENT_CHUNK (например, h_hash) получают чанки строго по порядку, поэтому они читаются из файла
+          nonlocal front, ordered
+          while front < len(segments) and segments[front][0] + segments[front][2] >= segments[front][1]:
+            front += 1
+          available = segments[front][0] + segments[front][2] if front < len(segments) else total_size
+          chunks = []
+          if need_chunks:
+            while ordered < available:
+              reader.seek(ordered)
+              chunk = reader.read(min(available - ordered, max(self.chunk_size, 2**20)))
+              if not chunk:
+                raise OSError("Unexpected end of file %s" % tmp_path)
+              chunks.append(chunk)
+              ordered += len(chunk)
+          for chunk in chunks:
+            self._on_chunk(data, chunk)
+        last_save = ms.now
+        try:
+          while True:
+            try:
+              index, size = progress.get(timeout=0.1)
+            except queue.Empty:
+              _raise_failed(futures)
+              if all(i.done() for i in futures) and progress.empty():
+                break
+              continue
+            segments[index][2] += size
+            data["downloaded"] += size
+            report()
+            self._on_progress(data)
+            if ms.now - last_save >= 1:
+              _raise_failed(futures)
+              save_checkpoint()
+              last_save = ms.now
+          report()
+          self._on_progress(data, True)
+          if front < len(segments):
+            raise ValueError("The file was not fully downloaded")
+        finally:
+          stop.set()
+          for i in futures:
+            i.cancel()
+          save_checkpoint()
+    except BaseException as exc:
+      data["errored_at"] = ms.now
+      data["errored"] = True
+      data["exception"] = exc
+      self.log.error("Failed to download")
+      self._run_handlers(self.EVENT_ERROR, data)
+      raise
+    finally:
+      session.close()
+    ms.file.move(tmp_path, path)
+    os.remove(checkpoint_path)
+    data["completed_at"] = ms.now
+    self._run_handlers(self.EVENT_COMPLETE, data)
+    return data
+
   def download2func(self, url: str, func, *, data: dict = None, enable_handlers: bool = True, **kw):
     """Скачать данные в функцию, которая принимает чанки байтов"""
-    for k, v in self.req_kw.items():
-      if k in {"headers", "params"}:
-        if not v is None:
-          kw.setdefault(k, {})
-          for k2, v2 in v.items():
-            kw[k].setdefault(k2, v2)
-      else:
-        kw.setdefault(k, v)
+    self._merge_req_kw(kw)
     if data is None:
       data = {}
     data["chunk_count"] = 0
@@ -528,13 +1054,23 @@ class FileDownloader(ms.ObjectBase):
         data["connected_at"] = ms.now
         data["resp"] = resp
         data["total_size"] = resp.headers.get("Content-Length")  # None|int
+        chunks = self._iter_content(resp)
+        if resp.status_code == 304 and data.get("cache_path"):
+          # Файл из кэша копирует download2file, обработчики получают его содержимое, только если им нужны чанки
+          func = ms.utils.return_None
+          data["total_size"] = os.path.getsize(data["cache_path"])
+          if enable_handlers and self.handlers.get(self.EVENT_CHUNK):
+            chunks = self._iter_file(data["cache_path"])
+          else:
+            chunks = ()
+            data["downloaded"] = data["total_size"]
         self._run_handlers(self.EVENT_STARTED, data)
-        for chunk in resp.iter_content(self.chunk_size):
-          data["chunk_count"] += 1
-          data["chunk"] = chunk
+        for chunk in chunks:
           data["downloaded"] += len(chunk)
           func(chunk)
-          self._run_handlers(self.EVENT_DOWNLOADING, data)
+          self._on_chunk(data, chunk)
+          self._on_progress(data)
+        self._on_progress(data, True)
     except BaseException as exc:
       data["errored_at"] = ms.now
       data["errored"] = True
@@ -546,56 +1082,140 @@ class FileDownloader(ms.ObjectBase):
     self._run_handlers(self.EVENT_COMPLETE, data)
     return data
 
-  def h_limit_size(self, max_size: int):
-    @self.add_handler(self.EVENT_STARTED)
-    def h_limit_size_start(total_size: None | int, **kw):
-      if total_size:
-        if total_size > max_size:
-          raise self.CancelError()
 
-    @self.add_handler(self.EVENT_DOWNLOADING)
-    def h_limit_size_progress(downloaded: int, **kw):
-      if downloaded > max_size:
-        raise self.CancelError()
-
-  def h_hash(self, hash_name: str, data_name: str = None, **hash_kw):
-    import hashlib
-    hash_type: type[hashlib._Hash] = getattr(hashlib, hash_name.lower())
-    if data_name is None:
-      data_name = hash_name
-    data_name_h = data_name + "_h"
-
-    @self.add_handler(self.EVENT_STARTED)
-    def h_hash_start(**kw):
-      kw[data_name_h] = hash_type(**hash_kw)
-
-    @self.add_handler(self.EVENT_DOWNLOADING)
-    def h_hash_update(chunk: bytes, **kw):
-      kw[data_name_h].update(chunk)
+class AsyncFileDownloader(_DownloaderBase):
+  """Асинхронное скачивание множества файлов по HTTP через одну сессию | `aiohttp`.
+  События и обработчики - как у `FileDownloader` (обработчики синхронные и вызываются в цикле событий).
+  `concurrency` - макс. кол-во одновременных скачиваний, `limit` и `limit_per_host` - макс. кол-во соединений всего и с одним сервером"""
 
-    @self.add_handler(self.EVENT_COMPLETE)
-    def h_hash_complete(data: dict, **kw):
-      digest = kw[data_name_h].digest()
-      data[data_name] = digest.hex()
-      data[data_name + "_b"] = digest
-    return data_name
-
-  def h_progressbar(self, data_name="h_progressbar", **pbar_kw):
-    import progressbar
-    pbar_kw.setdefault("min_poll_interval", 0.5)
+  def __init__(self, *, concurrency: int = 16, keepalive_timeout: float = 30, limit: int = 100, limit_per_host: int = 8, log=ms.log, session=None, **req_kw):
+    self.chunk_size = 65536  # 64 KB
+    self.concurrency = concurrency
+    self.connector_kw = {"keepalive_timeout": keepalive_timeout, "limit": limit, "limit_per_host": limit_per_host, "ttl_dns_cache": 300}
+    self.handlers: dict[int, list] = {}
+    self.log = log
+    self.req_kw = req_kw
+    self.session = session
+    self._own_session = session is None
+
+  async def __aenter__(self):
+    await self.get_session()
+    return self
+
+  async def __aexit__(self, *a):
+    await self.close()
+
+  async def get_session(self):
+    """Общая сессия `aiohttp.ClientSession` (создаётся при первом вызове)"""
+    if self.session is None or self.session.closed:
+      import aiohttp
+      self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(**self.connector_kw))
+      self._own_session = True
+    return self.session
+
+  async def close(self):
+    """Закрыть сессию, если она создана этим объектом"""
+    if self._own_session and self.session is not None:
+      await self.session.close()
+      self.session = None
+
+  async def download2file(self, url: str, path: str, **kw) -> dict:
+    """Скачать данные в файл. Запись выполняется в отдельном потоке, чтобы не блокировать цикл событий"""
+    import asyncio
+    real_path = ms.path.path2str(path)
+    kw.setdefault("data", {})
+    kw["data"]["real_path"] = real_path
+    tmp_path = real_path + ".ms2downloading"
+    kw["data"]["tmp_path"] = tmp_path
+    try:
+      with open(tmp_path, "wb") as f:
+        kw["data"]["io"] = f
+        await self.download2func(url, lambda chunk: asyncio.to_thread(f.write, chunk), **kw)
+    except BaseException:
+      if os.path.isfile(tmp_path):
+        os.remove(tmp_path)
+      raise
+    ms.file.move(tmp_path, real_path)
+    return kw["data"]
 
-    @self.add_handler(self.EVENT_STARTED)
-    def h_pbar_start(total_size: None | int, data: dict, **kw):
-      data[data_name] = progressbar.ProgressBar(**pbar_kw).start(total_size)
+  async def download2func(self, url: str, func, *, data: dict = None, enable_handlers: bool = True, **kw) -> dict:
+    """Скачать данные в функцию, которая принимает чанки байтов. Если функция возвращает awaitable, он дожидается перед чтением следующего чанка"""
+    self._merge_req_kw(kw)
+    if data is None:
+      data = {}
+    data["chunk_count"] = 0
+    data["data"] = data
+    data["downloaded"] = 0
+    data["downloader"] = self
+    data["enable_handlers"] = enable_handlers
+    data["errored"] = False
+    data["func"] = func
+    data["req_kw"] = kw
+    data["started_at"] = ms.now
+    data["url"] = url
+    method = kw.pop("method", "GET")
+    self._run_handlers(self.EVENT_STARTING, data)
+    try:
+      session = await self.get_session()
+      async with session.request(method, url, **kw) as resp:
+        resp.raise_for_status()
+        data["connected_at"] = ms.now
+        data["resp"] = resp
+        data["total_size"] = resp.content_length  # None|int
+        self._run_handlers(self.EVENT_STARTED, data)
+        size = self.chunk_size
+        while True:
+          started = time.perf_counter()
+          chunk = await resp.content.read(size)
+          if not chunk:
+            break
+          if self.adaptive_chunk_size:
+            size = self._next_chunk_size(size, len(chunk), time.perf_counter() - started)
+          data["downloaded"] += len(chunk)
+          result = func(chunk)
+          if inspect.isawaitable(result):
+            await result
+          self._on_chunk(data, chunk)
+          self._on_progress(data)
+        self._on_progress(data, True)
+    except BaseException as exc:
+      data["errored_at"] = ms.now
+      data["errored"] = True
+      data["exception"] = exc
+      self.log.error("Failed to download %s", url)
+      self._run_handlers(self.EVENT_ERROR, data)
+      raise
+    data["completed_at"] = ms.now
+    self._run_handlers(self.EVENT_COMPLETE, data)
+    return data
 
-    @self.add_handler(self.EVENT_DOWNLOADING)
-    def h_pbar_update(downloaded: int, **kw):
-      kw[data_name].update(downloaded)
+  async def download_many(self, jobs: Iterable[tuple[str, str]], **kw) -> AsyncIterator[dict]:
+    """Скачать файлы по парам (URL, путь), не больше `concurrency` одновременно. `jobs` читается по мере необходимости.
+    Данные скачиваний (как у `download2file`) выдаются по мере завершения; при ошибке в них `errored=True` и `exception`"""
+    import asyncio
 
-    @self.add_handler(self.EVENT_END)
-    def h_pbar_complete(errored: bool, **kw):
-      kw[data_name].finish(dirty=errored)
-    return data_name
+    async def job(url: str, path: str) -> dict:
+      data = {"path": path}
+      try:
+        await self.download2file(url, path, data=data, **kw)
+      except (Exception, self.CancelError):
+        pass  # Ошибка уже записана в data, отмена одного скачивания не прерывает остальные
+      return data
+    pending = set()
+    try:
+      for url, path in jobs:
+        if len(pending) >= self.concurrency:
+          done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+          for i in done:
+            yield i.result()
+        pending.add(asyncio.ensure_future(job(url, path)))
+      while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for i in done:
+          yield i.result()
+    finally:
+      for i in pending:
+        i.cancel()
 
 
 class PlatformInfo(ms.ObjectBase):
@@ -68,7 +68,7 @@ class BaseClient(ms.ObjectBase):
   def http(self) -> requests.Session:
     """HTTP сессия"""
     if self._http is None:
-      self._http = requests.Session()
+      self._http = ms.utils.http_pool.mount(requests.Session())
     return self._http
 
   def _request(self, http_method: str, api_method: str, *, raise_for_status: bool = True, url_data: dict[str, str] = None, **kw):
@@ -0,0 +1,17 @@
+"""Замеры производительности: `ms2-bench <набор>`"""
+import argparse
+from MainShortcuts2.core import ms
+
+
+@ms.utils.main_func(__name__)
+def main(args: argparse.Namespace = None):
+  if args is None:
+    from . import download, hashing, intern, serialize
+    argp = argparse.ArgumentParser("ms2-bench", description="замеры производительности MainShortcuts2")
+    subp = argp.add_subparsers(dest="command", required=True)
+    serialize.add_parser(subp)
+    intern.add_parser(subp)
+    hashing.add_parser(subp)
+    download.add_parser(subp)
+    args = argp.parse_args()
+  return args.func(args)
@@ -0,0 +1,85 @@
+"""Общие функции для замеров"""
+import argparse
+import gc
+import json
+import pickle
+import platform
+import sys
+import time
+import tracemalloc
+import typing
+from MainShortcuts2.core import ms
+
+
+def add_output_args(argp: argparse.ArgumentParser):
+  argp.add_argument("--json", nargs="?", const="-", metavar="PATH", help="вывести результаты в JSON (в файл или в stdout)")
+
+
+def best_time(func: typing.Callable, repeat: int = 3) -> tuple[typing.Any, float]:
+  """Результат функции и лучшее время из `repeat` запусков"""
+  best = None
+  result = None
+  for _ in range(max(1, repeat)):
+    result = None
+    gc.collect()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    if best is None or elapsed < best:
+      best = elapsed
+  return result, best
+
+
+def mb_per_s(size: int, seconds: float) -> float | None:
+  return size / seconds / 2**20 if seconds else None
+
+
+def payload_size(data) -> int:
+  """Размер исходных данных для расчёта МБ/с - длина в pickle. Не зависит от проверяемого формата и сжатия, поэтому скорости сравнимы между форматами"""
+  return len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+
+def peak_memory(func: typing.Callable) -> int:
+  """Пиковый объём памяти, выделенной во время работы функции (байт). Замеряется отдельно, так как `tracemalloc` сильно замедляет работу"""
+  gc.collect()
+  tracemalloc.start()
+  try:
+    func()
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+
+def environment() -> dict:
+  return {
+      "machine": platform.machine(),
+      "ms2_version": ms.version,
+      "platform": platform.platform(),
+      "python": platform.python_version(),
+      "time": time.time(),
+  }
+
+
+def format_table(headers: list[str], rows: list[list]) -> str:
+  rows = [[str(i) for i in row] for row in [headers] + rows]
+  widths = [max(len(row[n]) for row in rows) for n in range(len(headers))]
+  lines = []
+  for row in rows:
+    cells = [row[0].ljust(widths[0])] + [row[n].rjust(widths[n]) for n in range(1, len(row))]
+    lines.append("  ".join(cells))
+  return "\n".join(lines)
+
+
+def output(args: argparse.Namespace, name: str, results: list[dict], table: str):
+  """Вывести таблицу или JSON (`--json`)"""
+  if args.json is None:
+    print(table)
+    return
+  data = {"bench": name, "environment": environment(), "results": results}
+  text = json.dumps(data, ensure_ascii=False, indent=2)
+  if args.json == "-":
+    print(text)
+  else:
+    with open(args.json, "w", encoding="utf-8") as f:
+      f.write(text)
+    print("Результаты сохранены в " + args.json, file=sys.stderr)
@@ -0,0 +1,104 @@
+"""Накладные расходы обработчиков `FileDownloader`: события на каждый чанк, ограничение частоты, адаптивный размер чанка"""
+import argparse
+import http.server
+import os
+import threading
+import typing
+from MainShortcuts2.core import ms
+from ._common import add_output_args, best_time, format_table, mb_per_s, output
+
+CONFIGS: dict[str, dict[str, typing.Any]] = {
+    "no-handlers": {"handlers": False},
+    "every-chunk": {},
+    "throttled": {"progress_interval": 0.1},
+    "adaptive": {"adaptive_chunk_size": True},
+    "adaptive-throttled": {"adaptive_chunk_size": True, "progress_interval": 0.1},
+}
+
+
+def start_server(payload: bytes) -> http.server.ThreadingHTTPServer:
+  """Локальный HTTP сервер, отдающий `payload` по любому пути"""
+  class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+      self.send_response(200)
+      self.send_header("Content-Length", str(len(payload)))
+      self.end_headers()
+      view = memoryview(payload)
+      for i in range(0, len(view), 2**18):
+        self.wfile.write(view[i:i + 2**18])
+
+    def log_message(self, *a):
+      pass
+  server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+
+def bench_one(name: str, url: str, size: int, repeat: int = 3) -> dict:
+  config = dict(CONFIGS[name])
+  downloader = ms.advanced.FileDownloader()
+  if config.pop("handlers", True):
+    downloader.h_hash("sha256")
+
+    @downloader.add_handler(downloader.EVENT_DOWNLOADING)
+    def progress(downloaded: int, **kw):  # Как у прогрессбара
+      kw["data"]["shown"] = downloaded
+  for k, v in config.items():
+    setattr(downloader, k, v)
+  events = [0]
+
+  @downloader.add_handler(downloader.EVENT_DOWNLOADING)
+  def count(**kw):
+    events[0] += 1
+
+  def run():
+    events[0] = 0
+    return downloader.download2null(url)
+  data, elapsed = best_time(run, repeat)
+  return {
+      "chunks": data["chunk_count"],
+      "config": name,
+      "events": events[0],
+      "mb_s": mb_per_s(size, elapsed),
+      "size": size,
+      "time_s": elapsed,
+  }
+
+
+def run_all(configs: list[str], size: int, repeat: int = 3) -> list[dict]:
+  server = start_server(os.urandom(size))
+  try:
+    url = "http://127.0.0.1:%i/payload" % server.server_address[1]
+    return [bench_one(name, url, size, repeat) for name in configs]
+  finally:
+    server.shutdown()
+    server.server_close()
+
+
+def to_table(results: list[dict]) -> str:
+  headers = ["CONFIG", "SIZE, MB", "TIME, ms", "MB/s", "CHUNKS", "DOWNLOADING EVENTS"]
+  rows = []
+  for i in results:
+    rows.append([
+        i["config"],
+        "%.1f" % (i["size"] / 2**20),
+        "%.2f" % (i["time_s"] * 1000),
+        "%.1f" % i["mb_s"],
+        i["chunks"],
+        i["events"],
+    ])
+  return format_table(headers, rows)
+
+
+def add_parser(subp: argparse._SubParsersAction):
+  argp = subp.add_parser("download", help="накладные расходы обработчиков FileDownloader")
+  argp.add_argument("-c", "--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS), help="настройки скачивания")
+  argp.add_argument("-s", "--size", type=int, default=256, help="размер данных (МБ)")
+  argp.add_argument("-r", "--repeat", type=int, default=3, help="кол-во повторов, берётся лучшее время")
+  add_output_args(argp)
+  argp.set_defaults(func=run)
+
+
+def run(args: argparse.Namespace):
+  results = run_all(args.configs, args.size * 2**20, args.repeat)
+  output(args, "download", results, to_table(results))
@@ -0,0 +1,104 @@
+"""Скорость хеширования файлов: построчное чтение, блоки с прогрессом, `hashlib.file_digest`"""
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import typing
+from MainShortcuts2.core import ms
+from MainShortcuts2.ms2hash import HASH_TYPES, hash_file
+from ._common import add_output_args, best_time, format_table, output
+
+
+def write_text(path: str, size: int):
+  """Текст из коротких строк"""
+  rnd = random.Random(size)
+  words = [b"alpha", b"beta", b"gamma", b"delta", b"epsilon", b"zeta", b"eta", b"theta"]
+  line = b"\n".join(b" ".join(rnd.choice(words) for _ in range(rnd.randint(1, 8))) for _ in range(4096)) + b"\n"
+  _write_repeated(path, line, size)
+
+
+def write_binary(path: str, size: int):
+  """Случайные байты без переводов строки"""
+  block = os.urandom(2**20).replace(b"\n", b"\0")
+  _write_repeated(path, block, size)
+
+
+def _write_repeated(path: str, block: bytes, size: int):
+  with open(path, "wb") as f:
+    while size > 0:
+      f.write(block[:size])
+      size -= len(block)
+
+
+FILES: dict[str, typing.Callable[[str, int], None]] = {
+    "text": write_text,
+    "binary": write_binary,
+}
+
+
+def _hash_lines(path: str, hash_type: str):
+  # Старый способ из ms2hash и ms2app
+  hash = hashlib.new(hash_type)
+  with open(path, "rb") as f:
+    for i in f:
+      hash.update(i)
+  return hash
+
+
+METHODS: dict[str, typing.Callable[[str, str], typing.Any]] = {
+    "lines": _hash_lines,
+    "chunked": lambda path, hash_type: hash_file(path, hash_type, ms.utils.return_None),
+    "file_digest": hash_file,
+}
+
+
+def run_all(files: list[str], methods: list[str], hash_type: str, size: int, repeat: int = 3) -> list[dict]:
+  results = []
+  with tempfile.TemporaryDirectory() as tmp:
+    for file_name in files:
+      path = os.path.join(tmp, file_name)
+      FILES[file_name](path, size)
+      expected = None
+      for method in methods:
+        result = {"file": file_name, "method": method, "size": size}
+        hash, elapsed = best_time(lambda: METHODS[method](path, hash_type), repeat)
+        if expected is None:
+          expected = hash.digest()
+        result["time_s"] = elapsed
+        result["gb_s"] = size / elapsed / 2**30 if elapsed else None
+        result["same_hash"] = hash.digest() == expected
+        results.append(result)
+      os.remove(path)
+  return results
+
+
+def to_table(results: list[dict]) -> str:
+  headers = ["FILE", "METHOD", "SIZE, MB", "TIME, ms", "GB/s", "SAME HASH"]
+  rows = []
+  for i in results:
+    rows.append([
+        i["file"],
+        i["method"],
+        "%.1f" % (i["size"] / 2**20),
+        "%.2f" % (i["time_s"] * 1000),
+        "%.2f" % i["gb_s"],
+        "да" if i["same_hash"] else "нет",
+    ])
+  return format_table(headers, rows)
+
+
+def add_parser(subp: argparse._SubParsersAction):
+  argp = subp.add_parser("hash", help="скорость хеширования файлов")
+  argp.add_argument("-f", "--files", nargs="+", choices=list(FILES), default=list(FILES), help="типы файлов")
+  argp.add_argument("-m", "--methods", nargs="+", choices=list(METHODS), default=list(METHODS), help="способы чтения")
+  argp.add_argument("-s", "--size", type=int, default=256, help="размер файла (МБ)")
+  argp.add_argument("-t", "--type", choices=HASH_TYPES, default="sha256", help="тип контрольной суммы")
+  argp.add_argument("-r", "--repeat", type=int, default=3, help="кол-во повторов, берётся лучшее время")
+  add_output_args(argp)
+  argp.set_defaults(func=run)
+
+
+def run(args: argparse.Namespace):
+  results = run_all(args.files, args.methods, args.type, args.size * 2**20, args.repeat)
+  output(args, "hash", results, to_table(results))
@@ -0,0 +1,94 @@
+"""Загрузка MS2Dat с общими ключами и короткими строками (`set_intern_strings`) и без"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from MainShortcuts2.core import ms
+from ._common import add_output_args, format_table, output
+
+FIELDS = 20
+
+
+def payload_records(n: int):
+  """Однотипные записи: одинаковые ключи и повторяющиеся короткие значения"""
+  rnd = random.Random(n)
+  statuses = ["active", "blocked", "deleted", "pending"]
+  countries = ["ru", "us", "de", "fr", "cn", "jp", "br", "in"]
+  records = []
+  for i in range(n):
+    rec = {"id": i, "status": rnd.choice(statuses), "country": rnd.choice(countries)}
+    for f in range(FIELDS - len(rec)):
+      rec["field_%02i" % f] = rnd.randint(0, 1000) if f % 2 else "value_%i" % rnd.randint(0, 50)
+    records.append(rec)
+  return records
+
+
+def _count_keys(data: list[dict]) -> int:
+  """Кол-во разных объектов-ключей во всех записях"""
+  return len({id(k) for rec in data for k in rec})
+
+
+def bench_one(buf: bytes, interned: bool, repeat: int = 3) -> dict:
+  inst = ms.ms2dat_v1.MS2Dat1()
+  inst.set_intern_strings(interned)
+  result = {"intern_strings": interned}
+  best = None
+  for _ in range(max(1, repeat)):
+    gc.collect()
+    started = time.perf_counter()
+    inst.loads(buf)
+    elapsed = time.perf_counter() - started
+    if best is None or elapsed < best:
+      best = elapsed
+  result["load_s"] = best
+  gc.collect()
+  tracemalloc.start()
+  try:
+    data = inst.loads(buf)
+    gc.collect()
+    # Память, которую занимает загруженный объект (без временных буферов)
+    result["retained"] = tracemalloc.get_traced_memory()[0]
+  finally:
+    tracemalloc.stop()
+  result["distinct_keys"] = _count_keys(data)
+  return result
+
+
+def run_all(n: int, repeat: int = 3) -> list[dict]:
+  inst = ms.ms2dat_v1.MS2Dat1()
+  inst.set_use_dict(False)  # Иначе ключи уже общие за счёт словаря MS2Dat
+  buf = inst.dumps(payload_records(n))
+  results = [bench_one(buf, False, repeat), bench_one(buf, True, repeat)]
+  for i in results:
+    i["count"] = n
+    i["saved"] = results[0]["retained"] - i["retained"]
+  return results
+
+
+def to_table(results: list[dict]) -> str:
+  headers = ["INTERN", "RECORDS", "LOAD, ms", "RETAINED, MB", "SAVED, MB", "DISTINCT KEYS"]
+  rows = []
+  for i in results:
+    rows.append([
+        "да" if i["intern_strings"] else "нет",
+        i["count"],
+        "%.2f" % (i["load_s"] * 1000),
+        "%.1f" % (i["retained"] / 2**20),
+        "%.1f" % (i["saved"] / 2**20),
+        i["distinct_keys"],
+    ])
+  return format_table(headers, rows)
+
+
+def add_parser(subp: argparse._SubParsersAction):
+  argp = subp.add_parser("intern", help="загрузка MS2Dat с общими ключами и строками")
+  argp.add_argument("-n", "--count", type=int, default=100000, help="кол-во записей")
+  argp.add_argument("-r", "--repeat", type=int, default=3, help="кол-во повторов, берётся лучшее время")
+  add_output_args(argp)
+  argp.set_defaults(func=run)
+
+
+def run(args: argparse.Namespace):
+  results = run_all(args.count, args.repeat)
+  output(args, "intern", results, to_table(results))
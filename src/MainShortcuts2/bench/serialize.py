@@ -0,0 +1,174 @@
+"""Сравнение форматов сериализации: MS2Dat (профили), pickle, JSON, any2json, TOML"""
+import argparse
+import datetime
+import os
+import pickle
+import random
+import typing
+import uuid
+from MainShortcuts2.core import ms
+from ._common import add_output_args, best_time, format_table, mb_per_s, output, payload_size, peak_memory
+
+
+def payload_flat(n: int):
+  """Список плоских словарей, как строки таблицы"""
+  return [{"active": i % 3 == 0, "id": i, "name": "user %i" % i, "score": i / 7, "tags": ["tag%i" % (i % 20), "group%i" % (i % 5)]} for i in range(n)]
+
+
+def payload_deep(n: int):
+  """Дерево словарей и списков глубиной ~log2(n)"""
+  def build(count: int, depth: int):
+    if count <= 1:
+      return {"depth": depth, "leaf": True}
+    half = count // 2
+    return {"depth": depth, "children": [build(half, depth + 1), build(count - half, depth + 1)]}
+  return build(n, 0)
+
+
+def payload_strings(n: int):
+  """Строки разной длины, в том числе не ASCII"""
+  rnd = random.Random(n)
+  words = ["alpha", "beta", "gamma", "дельта", "эпсилон", "zeta", "η", "θήτα"]
+  return [" ".join(rnd.choice(words) for _ in range(rnd.randint(1, 30))) for _ in range(n)]
+
+
+def payload_numbers(n: int):
+  """Целые и дробные числа"""
+  rnd = random.Random(n)
+  return {"floats": [rnd.random() * 1e6 for _ in range(n)], "ints": [rnd.randint(-2**40, 2**40) for _ in range(n)]}
+
+
+def payload_datetime_uuid(n: int):
+  """`datetime`, `timedelta` и `UUID`"""
+  rnd = random.Random(n)
+  start = datetime.datetime(2020, 1, 1)
+  return [{"created": start + datetime.timedelta(seconds=rnd.randint(0, 10**8)), "id": uuid.UUID(int=rnd.getrandbits(128)), "ttl": datetime.timedelta(seconds=rnd.randint(0, 10**6))} for _ in range(n)]
+
+
+PAYLOADS: dict[str, typing.Callable[[int], typing.Any]] = {
+    "flat": payload_flat,
+    "deep": payload_deep,
+    "strings": payload_strings,
+    "numbers": payload_numbers,
+    "datetime_uuid": payload_datetime_uuid,
+}
+
+
+def _ms2dat(version: int, profile: str = None, workers: int = 0):
+  if version == 1:
+    inst = ms.ms2dat_v1.MS2Dat1()
+  else:
+    inst = ms.ms2dat_v2.MS2Dat2()
+  if profile is not None:
+    getattr(inst, "profile_" + profile)()
+  if workers:
+    inst.set_workers(workers)
+  return inst.dumps, inst.loads
+
+
+def _pickle():
+  return lambda data: pickle.dumps(data, pickle.HIGHEST_PROTOCOL), pickle.loads
+
+
+def _json():
+  return lambda data: ms.json.encode(data).encode("utf-8"), ms.json.decode
+
+
+def _any2json():
+  return lambda data: ms.any2json.encode(data).encode("utf-8"), ms.any2json.decode
+
+
+def _toml():
+  import toml
+  # В TOML корнем может быть только таблица
+  return lambda data: toml.dumps({"data": data}).encode("utf-8"), lambda text: toml.loads(text.decode("utf-8"))["data"]
+
+
+FORMATS: dict[str, typing.Callable[[], tuple[typing.Callable, typing.Callable]]] = {
+    "ms2dat1": lambda: _ms2dat(1),
+    "ms2dat1-fast": lambda: _ms2dat(1, "fast"),
+    "ms2dat1-safe": lambda: _ms2dat(1, "safe"),
+    "ms2dat1-minimum_size": lambda: _ms2dat(1, "minimum_size"),
+    "ms2dat1-parallel": lambda: _ms2dat(1, workers=os.cpu_count()),
+    "ms2dat2": lambda: _ms2dat(2),
+    "pickle": _pickle,
+    "json": _json,
+    "any2json": _any2json,
+    "toml": _toml,
+}
+
+
+def bench_one(fmt: str, payload_name: str, data, repeat: int = 3, memory: bool = True, size: int = None) -> dict:
+  """Замер одного формата на одних данных. МБ/с считаются от `size` (по умолчанию `payload_size(data)`), а не от размера результата"""
+  if size is None:
+    size = payload_size(data)
+  result = {"format": fmt, "payload": payload_name, "payload_size": size}
+  try:
+    dumps, loads = FORMATS[fmt]()
+    buf, t_dump = best_time(lambda: dumps(data), repeat)
+    loaded, t_load = best_time(lambda: loads(buf), repeat)
+  except Exception as err:
+    result["error"] = "%s: %s" % (type(err).__name__, err)
+    return result
+  result["size"] = len(buf)
+  result["dump_s"] = t_dump
+  result["load_s"] = t_load
+  result["dump_mb_s"] = mb_per_s(size, t_dump)
+  result["load_mb_s"] = mb_per_s(size, t_load)
+  result["roundtrip"] = loaded == data
+  if memory:
+    result["dump_peak"] = peak_memory(lambda: dumps(data))
+    result["load_peak"] = peak_memory(lambda: loads(buf))
+  return result
+
+
+def run_all(formats: list[str], payloads: list[str], n: int, repeat: int = 3, memory: bool = True) -> list[dict]:
+  results = []
+  for payload_name in payloads:
+    data = PAYLOADS[payload_name](n)
+    size = payload_size(data)
+    for fmt in formats:
+      results.append(bench_one(fmt, payload_name, data, repeat, memory, size))
+  return results
+
+
+def _mb(size):
+  return "-" if size is None else "%.1f" % (size / 2**20)
+
+
+def to_table(results: list[dict]) -> str:
+  headers = ["PAYLOAD", "FORMAT", "SIZE, KB", "DUMP, ms", "DUMP, MB/s", "LOAD, ms", "LOAD, MB/s", "DUMP PEAK, MB", "LOAD PEAK, MB", "ROUNDTRIP"]
+  rows = []
+  for i in results:
+    if "error" in i:
+      rows.append([i["payload"], i["format"], "-", "-", "-", "-", "-", "-", "-", i["error"][:40]])
+      continue
+    rows.append([
+        i["payload"],
+        i["format"],
+        "%.1f" % (i["size"] / 1024),
+        "%.2f" % (i["dump_s"] * 1000),
+        "%.1f" % i["dump_mb_s"],
+        "%.2f" % (i["load_s"] * 1000),
+        "%.1f" % i["load_mb_s"],
+        _mb(i.get("dump_peak")),
+        _mb(i.get("load_peak")),
+        "да" if i["roundtrip"] else "нет",
+    ])
+  return format_table(headers, rows) + "\nMB/s - от размера исходных данных (в pickle), одинакового для всех форматов"
+
+
+def add_parser(subp: argparse._SubParsersAction):
+  argp = subp.add_parser("serialize", help="сравнение форматов сериализации")
+  argp.add_argument("-f", "--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS), help="форматы")
+  argp.add_argument("-n", "--count", type=int, default=10000, help="размер данных (кол-во записей)")
+  argp.add_argument("-p", "--payloads", nargs="+", choices=list(PAYLOADS), default=list(PAYLOADS), help="наборы данных")
+  argp.add_argument("-r", "--repeat", type=int, default=3, help="кол-во повторов, берётся лучшее время")
+  argp.add_argument("--no-memory", action="store_true", help="не замерять пиковую память")
+  add_output_args(argp)
+  argp.set_defaults(func=run)
+
+
+def run(args: argparse.Namespace):
+  results = run_all(args.formats, args.payloads, args.count, args.repeat, not args.no_memory)
+  output(args, "serialize", results, to_table(results))
@@ -48,6 +48,27 @@ class MS2:
   def reload(self):
     self.pid = os.getpid()
 
+  def enable_startup_profiling(self):
+    """Замерять время и новые модули при первом обращении к подмодулям `ms` и при импортах внутри пакета. Также включается переменной окружения `MS2_PROFILE_STARTUP`"""
+    from ._startup_profiler import profiler
+    profiler.enable(type(self))
+
+  def startup_report(self):
+    """Отчёт о загрузке подмодулей (`str()` - таблица, `.to_json()` - JSON)"""
+    from ._startup_profiler import profiler
+    if not profiler.enabled:
+      raise RuntimeError("Startup profiling is not enabled")
+    return profiler.report()
+
+  @cached_property
+  def config(self):
+    """Конфиг MainShortcuts2. Файл читается только при первом обращении"""
+    try:
+      from .core_config import CoreConfig
+      return CoreConfig()
+    except Exception:
+      return None
+
   @cached_property
   def credits(self) -> str:
     line = "------------------------------------------------"
@@ -221,11 +242,18 @@ class MS2:
     from . import ms2dat1
     return ms2dat1
 
+  @cached_property
+  def ms2dat_v2(self):
+    from . import ms2dat2
+    return ms2dat2
+
   @cached_property
   def ms2dat(self):
-    """Авто выбор при загрузке, последняя версия при сохранении"""
+    """Авто выбор при загрузке, v1 при сохранении (v2 - `ms.ms2dat_v2`)"""
     from . import _ms2dat_auto
     return _ms2dat_auto
 
 
 ms = MS2()
+if os.environ.get("MS2_PROFILE_STARTUP"):  # _startup_profiler.ENV_NAME, модуль импортируется только при включении
+  ms.enable_startup_profiling()
@@ -15,6 +15,7 @@ class ms2hash_version(enum.IntEnum):
   VA = enum.auto()
   VB = enum.auto()
   VH = enum.auto()
+  MERKLE = enum.auto()
 
 
 class Path(pathlib.Path):
@@ -170,7 +171,7 @@ class Path(pathlib.Path):
     return st1.st_dev == st2.st_dev and st1.st_ino == st2.st_ino
 
   def write_ms2dat(self, data, **kw):
-    """Сохранить данные в последней версии формата MS2Dat"""
+    """Сохранить данные в формате MS2Dat (версия по умолчанию `ms.ms2dat`)"""
     ms.ms2dat.write_file(data, self, **kw)
 
   def write_ms2dat_v1(self, data, ms2dat_inst=None, **kw):
@@ -179,10 +180,20 @@ class Path(pathlib.Path):
       ms2dat_inst = ms.ms2dat_v1.inst
     ms2dat_inst.write_file(data, self, **kw)
 
+  def write_ms2dat_v2(self, data, ms2dat_inst=None, **kw):
+    """Сохранить данные в формате MS2Dat v2"""
+    if ms2dat_inst is None:
+      ms2dat_inst = ms.ms2dat_v2.inst
+    ms2dat_inst.write_file(data, self, **kw)
+
   def read_ms2dat(self, **kw):
     """Прочитать данные в формате MS2Dat"""
     return ms.ms2dat.read_file(self, **kw)
 
+  def open_ms2dat(self, **kw):
+    """Открыть файл MS2Dat для загрузки по частям"""
+    return ms.ms2dat.open(self, **kw)
+
   def copy_to_io(self, fdest: typing.BinaryIO):
     """Скопировать содержимое в открытый файл"""
     with self.open("rb") as fsrc:
@@ -219,16 +230,22 @@ class Path(pathlib.Path):
     import zstandard
     return self._compress(zstandard.open, ".zst", dest, keep, mode="wb", **kw)
 
-  def hash(self, alg: str, bufsize=2**18):
-    """Хешировать файл одним алгоритмом"""
+  def hash(self, alg: str, bufsize=2**18, cache=None):
+    """Хешировать файл одним алгоритмом. `cache` - `ms.ms2hash.HashCache`, `None` - кэш по умолчанию, `False` - без кэша"""
+    cache = ms.ms2hash.get_cache(cache)
+    if cache is not None:
+      return cache.hash_multi(self, [alg], lambda path, algs: self.hash_multi(algs, bufsize, False))[alg]
     import hashlib
     with self.open("rb") as f:
       return hashlib.file_digest(f, alg, _bufsize=bufsize).digest()
 
-  def hash_multi(self, algs: set[str], bufsize=2**18) -> dict[str, bytes]:
-    """Хешировать файл несколькими алгоритмами"""
+  def hash_multi(self, algs: set[str], bufsize=2**18, cache=None) -> dict[str, bytes]:
+    """Хешировать файл несколькими алгоритмами. `cache` - как в `hash`"""
     if not algs:
       return {}
+    cache = ms.ms2hash.get_cache(cache)
+    if cache is not None:
+      return cache.hash_multi(self, algs, lambda path, algs: self.hash_multi(algs, bufsize, False))
     import hashlib
     hashes = {i: hashlib.new(i) for i in algs}
     updaters = [i.update for i in hashes.values()]
@@ -243,12 +260,17 @@ class Path(pathlib.Path):
     return {k: v.digest() for k, v in hashes.items()}
 
   def generate_ms2hash(self, alg="sha3-256", overwrite=False, version=ms2hash_version.LEGACY, **kw):
-    """Сгенерировать файл хеша рядом с этим файлом. **Внимание**: версия по умолчанию изменится в будущем обновлении"""
-    if version == ms2hash_version.LEGACY:
+    """Сгенерировать файл хеша рядом с этим файлом. **Внимание**: версия по умолчанию изменится в будущем обновлении.
+    `MERKLE` - хеши частей и дерево Меркла (`ms.ms2hash.Format2`), можно передать `chunk_size` и `workers`"""
+    if version in (ms2hash_version.LEGACY, ms2hash_version.MERKLE):
       dest = self.with_name(self.name + ms.ms2hash.HASH_SUFFIX)
       if dest.exists() and not overwrite:
         raise FileExistsError(dest)
-      hash = ms.ms2hash.Format1.generate(self, **kw)
+      kw.setdefault("hash_type", alg.replace("-", "_"))
+      if version == ms2hash_version.MERKLE:
+        hash = ms.ms2hash.Format2.generate(self, **kw)
+      else:
+        hash = ms.ms2hash.Format1.generate(self, kw.pop("enable_pbar", False), **kw)
       return dest.write_json(hash.to_dict())
     from MPL import ms2hash  # WIP, скоро будет в MS2
     if version == ms2hash_version.V0:
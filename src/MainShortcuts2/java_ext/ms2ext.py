@@ -280,8 +280,11 @@ def download_file(url: str, path: os.PathLike, *,
     return fallback.file_downloader_v1(config)
 
 
-def hash_file(path: os.PathLike, algs: set[str], *, bufSize: int = None, **kw):
-  """Хешировать большой файл"""
+def hash_file(path: os.PathLike, algs: set[str], *, bufSize: int = None, cache=None, **kw):
+  """Хешировать большой файл. `cache` - `ms.ms2hash.HashCache`, `None` - кэш по умолчанию, `False` - без кэша"""
+  cache = ms.ms2hash.get_cache(cache)
+  if cache is not None:
+    return results.FileHasherV1(cache.hash_multi(os.fspath(path), algs, lambda p, a: hash_file(p, a, bufSize=bufSize, cache=False, **kw)))
   config = configs.FileHasherV1()
   config["algs"] = list(algs)
   config["bufSize"] = bufSize
@@ -292,8 +295,12 @@ def hash_file(path: os.PathLike, algs: set[str], *, bufSize: int = None, **kw):
     return fallback.file_hasher_v1(config)
 
 
-def hash_many_files(paths: set[os.PathLike], algs: set[str], *, bufSize: int = None, **kw):
-  """Хешировать несколько файлов"""
+def hash_many_files(paths: set[os.PathLike], algs: set[str], *, bufSize: int = None, cache=None, **kw):
+  """Хешировать несколько файлов. `cache` - как в `hash_file`"""
+  cache = ms.ms2hash.get_cache(cache)
+  if cache is not None and algs:
+    hashed = cache.hash_many([os.fspath(i) for i in paths], algs, lambda p, a: hash_many_files(p, a, bufSize=bufSize, cache=False, **kw))
+    return {k: results.FileHasherV1(v) for k, v in hashed.items()}
   config = configs.FileHasherV2()
   config["algs"] = list(algs)
   config["bufSize"] = bufSize
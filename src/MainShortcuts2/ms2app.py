@@ -1,4 +1,3 @@
-import hashlib
 import os
 import shutil
 import subprocess
@@ -144,11 +143,8 @@ class App(ms.ObjectBase):
   @property
   def sha256(self) -> str:
     if self._sha256 is None:
-      with open(self.file, "rb") as f:
-        hash = hashlib.sha256()
-        for i in f:
-          hash.update(i)
-      self._sha256 = hash.hexdigest()
+      from MainShortcuts2.ms2hash import hash_file
+      self._sha256 = hash_file(self.file.path, "sha256").hexdigest()
     return self._sha256
 
   def open_zip(self, mode: str = "r", **kw) -> ZipFile:
@@ -1,17 +1,29 @@
+import array
 import datetime
 import hashlib
 import math
 import secrets
 import struct
+import sys
 import typing
 import uuid
 from io import BytesIO
+from itertools import chain
 from MainShortcuts2.ex.pathlib_ex import Path
 from MainShortcuts2.utils import int_size_unsigned
+BYTES_FORMATS = "B", "c"  # `memoryview` с этими форматами пишется как `bytes`
+CONTAINER_TYPES = dict, list, tuple, set
+EMPTY_CONTAINERS = {6: dict, 7: list, 8: tuple, 9: set}
 HASH_NAMES = None, "sha256", "sha3-256", "sha512"
 HASH_SIZES = 0, 32, 32, 64
+INTERN_MAX_SIZE = 64  # Строки и bytes до этого размера можно загружать общими объектами
 MAGIC_HEAD = b"MS2D"
+NO_BODY_TYPES = 0, 6, 7, 8, 9, 14  # У этих типов в заголовке не размер тела, а значение или кол-во элементов
+PARALLEL_SHARDS = 4  # Частей на один процесс при параллельном кодировании
+STREAM_CHUNK_SIZE = 2**20  # Размер порции для сжатия и записи в потоковом режиме
 SPECIAL_TYPES = None, False, True, float("-inf"), float("inf"), float("nan")
+_MISSING = object()  # Маркер отсутствующего значения
+unpack_double = struct.Struct("d").unpack_from
 
 
 def hash_data(hash_type: int, data: bytes):
@@ -21,26 +33,74 @@ def hash_data(hash_type: int, data: bytes):
   return hashlib.new(HASH_NAMES[hash_type], data).digest()
 
 
-def compress_data(compress_type: int, data: bytes):
-  """Сжатие данных, применяется только если результат меньше исходных данных"""
+def compress_data(compress_type: int, data: bytes, level: int = None, threads: int = 0):
+  """Сжатие данных, применяется только если результат меньше исходных данных. `level=None` - уровень по умолчанию для алгоритма, `threads` используется только zstd"""
   if compress_type == 1:
     import zlib
-    result = zlib.compress(data)
-    if len(result) < len(data):
-      return 1, result
+    result = zlib.compress(data, -1 if level is None else level)
   elif compress_type == 2:
     import bz2
-    result = bz2.compress(data)
-    if len(result) < len(data):
-      return 2, result
+    result = bz2.compress(data, 9 if level is None else level)
   elif compress_type == 3:
     import lzma  # СУПЕР сжатие
-    result = lzma.compress(data, lzma.FORMAT_ALONE, preset=9 | lzma.PRESET_EXTREME)
-    if len(result) < len(data):
-      return 3, result
+    result = lzma.compress(data, lzma.FORMAT_ALONE, preset=9 | lzma.PRESET_EXTREME if level is None else level)
+  elif compress_type == 4:
+    import zstandard
+    result = zstandard.ZstdCompressor(level=3 if level is None else level, threads=threads).compress(data)
+  elif compress_type == 5:
+    import lz4.frame
+    result = lz4.frame.compress(data, compression_level=0 if level is None else level)
+  else:
+    return 0, data
+  if len(result) < len(data):
+    return compress_type, result
   return 0, data
 
 
+def get_compressor(compress_type: int, level: int = None, threads: int = 0):
+  """Объект для потокового сжатия (`compress`+`flush`) с теми же настройками, что и `compress_data`"""
+  if compress_type == 0:
+    return None
+  if compress_type == 1:
+    import zlib
+    return zlib.compressobj(-1 if level is None else level)
+  if compress_type == 2:
+    import bz2
+    return bz2.BZ2Compressor(9 if level is None else level)
+  if compress_type == 3:
+    import lzma
+    return lzma.LZMACompressor(lzma.FORMAT_ALONE, preset=9 | lzma.PRESET_EXTREME if level is None else level)
+  if compress_type == 4:
+    import zstandard
+    return zstandard.ZstdCompressor(level=3 if level is None else level, threads=threads).compressobj()
+  if compress_type == 5:
+    return _LZ4Compressor(0 if level is None else level)
+  raise ValueError("Invalid compress type")
+
+
+class _LZ4Compressor:
+  """`lz4.frame.LZ4FrameCompressor` с интерфейсом `compress`+`flush`"""
+
+  def __init__(self, level: int):
+    import lz4.frame
+    self.compressor = lz4.frame.LZ4FrameCompressor(compression_level=level)
+    self.started = False
+
+  def _begin(self) -> bytes:
+    if self.started:
+      return b""
+    self.started = True
+    return self.compressor.begin()
+
+  def compress(self, data: bytes) -> bytes:
+    head = self._begin()
+    return head + self.compressor.compress(data)
+
+  def flush(self) -> bytes:
+    head = self._begin()
+    return head + self.compressor.flush()
+
+
 def decompress_data(compress_type: int, data: bytes):
   if compress_type == 0:
     return data
@@ -53,6 +113,12 @@ def decompress_data(compress_type: int, data: bytes):
   if compress_type == 3:
     import lzma
     return lzma.decompress(data)
+  if compress_type == 4:
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)  # Потоковый кадр не содержит размер
+  if compress_type == 5:
+    import lz4.frame
+    return lz4.frame.decompress(data)
   raise ValueError("Invalid compress type")
 
 
@@ -106,7 +172,7 @@ class Reader:
   def _read1(self):
     return self._read(1)[0]
 
-  def read_body(self, allow_unknown=False, verify=True):
+  def read_body(self, allow_unknown=False, verify=True, memoryview_bytes=False, intern_strings=False):
     body = self._read(self.body_size)  # compressed,encrypted
     if self.encrypted:
       body = self.ms2dat.decrypt_body(body)  # compressed
@@ -116,67 +182,185 @@ class Reader:
       saved = self._read(HASH_SIZES[self.hash_type])
       if reald != saved:
         raise ValueError("The file is corrupted")
-    with BytesIO(raw_body) as buf:
-      # Чтение словаря
-      d = []
-      for i in range(int.from_bytes(buf.read(3), "big")):
-        d.append(self.decode_obj(buf, d, allow_unknown))
-      # Чтение тела
-      return self.decode_obj(buf, d, allow_unknown)
+    self.allow_unknown = allow_unknown
+    self.memoryview_bytes = memoryview_bytes
+    self.intern_cache = {} if intern_strings else None
+    return self.decode_body(raw_body)
+
+  def decode_body(self, raw_body: bytes):
+    """Декодировать несжатое тело (словарь + объект)"""
+    view = memoryview(raw_body).toreadonly()
+    d = []
+    decode, tell = self._view_decoder(view, d, 3)
+    # Чтение словаря
+    for i in range(int.from_bytes(view[0:3], "big")):
+      d.append(decode())
+    # Чтение тела
+    return decode()
+
+  def decode_view(self, view: memoryview, pos: int, d: list) -> tuple[typing.Any | None, int]:
+    """Декодировать объект из `memoryview` без лишних копий. Возвращает объект и позицию после него"""
+    decode, tell = self._view_decoder(view, d, pos)
+    return decode(), tell()
+
+  def _view_decoder(self, view: memoryview, d: list, pos: int, allow_unknown: bool = None):
+    """Функция декодирования, которая двигает общую позицию в `view`, и функция получения позиции. Вложенность не ограничена: вместо рекурсии используется стек контейнеров"""
+    if allow_unknown is None:
+      allow_unknown = getattr(self, "allow_unknown", False)
+    ctypes = self.ms2dat.custom_types
+    from_bytes = int.from_bytes
+    memoryview_bytes = getattr(self, "memoryview_bytes", False)
+    intern_cache: dict | None = getattr(self, "intern_cache", None)  # значение: тот же объект
+    view_size = len(view)
+
+    def decode():
+      nonlocal pos
+      # Текущий контейнер хранится в локальных переменных, внешние - в стеке
+      cur_type = -1  # -1 - вне контейнеров
+      cur = None
+      remaining = 0
+      key = _MISSING
+      stack = []
+      while True:
+        head = view[pos]
+        typeid = head >> 4
+        sizesize = head & 0b1111
+        if sizesize == 1:
+          size = view[pos + 1]
+          pos += 2
+        else:
+          pos += 1
+          size = from_bytes(view[pos:pos + sizesize], "big")
+          pos += sizesize
+        if typeid == 0:  # Специальный тип
+          value = SPECIAL_TYPES[size]
+        elif 6 <= typeid <= 9:  # dict, list, tuple, set
+          if size:
+            stack.append((cur_type, cur, remaining, key))
+            cur_type = typeid
+            cur = {} if typeid == 6 else []
+            remaining = size
+            key = _MISSING
+            continue
+          value = EMPTY_CONTAINERS[typeid]()
+        elif typeid == 12:  # datetime + timezone
+          dt: datetime.datetime = decode()
+          td: datetime.timedelta = decode()
+          value = dt.replace(tzinfo=datetime.timezone(td))
+        elif typeid == 14:  # Ссылка на словарь
+          value = d[size]
+        else:
+          if typeid == 15:  # Пользовательский тип
+            ctypename = self.custom_types[view[pos]]
+            pos += 1
+          start = pos
+          pos += size
+          if pos > view_size:
+            raise ValueError("Unexpected end of data")
+          if typeid == 5:  # str
+            value = str(view[start:pos], "utf-8")
+            if intern_cache is not None and size <= INTERN_MAX_SIZE:
+              value = intern_cache.setdefault(value, value)
+          elif typeid == 1:  # int
+            value = from_bytes(view[start:pos], "big")
+          elif typeid == 2:  # int
+            value = -from_bytes(view[start:pos], "big")
+          elif typeid == 3:  # float
+            value = unpack_double(view, start)[0]
+          elif typeid == 4:  # bytes
+            if memoryview_bytes:
+              value = view[start:pos]
+            else:
+              value = view[start:pos].tobytes()
+              if intern_cache is not None and size <= INTERN_MAX_SIZE:
+                value = intern_cache.setdefault(value, value)
+          elif typeid == 10:  # datetime
+            value = datetime.datetime.fromtimestamp(unpack_double(view, start)[0])
+          elif typeid == 11:  # timedelta
+            value = datetime.timedelta(seconds=unpack_double(view, start)[0])
+          elif typeid == 13:  # UUID
+            value = uuid.UUID(bytes=view[start:pos].tobytes())
+          else:  # Пользовательский тип
+            ctype = ctypes.get(ctypename)
+            cbody = view[start:pos].tobytes()
+            if ctype is None:
+              if not allow_unknown:
+                raise ValueError(f"Unknown custom type: {ctypename}")
+              value = UnknownType(ctypename, cbody)
+            else:
+              value = ctype.decode_obj(self, cbody, d)
+        # Добавление в контейнеры, закрытие заполненных
+        while True:
+          if cur_type == 6:
+            if key is _MISSING:
+              key = value
+              break
+            cur[key] = value
+            key = _MISSING
+          elif cur_type < 0:
+            return value
+          else:
+            cur.append(value)
+          remaining -= 1
+          if remaining:
+            break
+          value = cur
+          if cur_type == 8:
+            value = tuple(value)
+          elif cur_type == 9:
+            value = set(value)
+          cur_type, cur, remaining, key = stack.pop()
+
+    def tell():
+      return pos
+    return decode, tell
 
   def decode_obj(self, buf: typing.IO[bytes], d: list, allow_unknown=False) -> typing.Any | None:
-    head = buf.read(1)[0]
+    """Декодировать объект из IO. Позиция ставится сразу после объекта.
+    У `BytesIO` декодируется текущее содержимое без копирования, из остальных IO читаются только байты объекта (`seek` не нужен)"""
+    getbuffer = getattr(buf, "getbuffer", None)
+    if getbuffer is None or getattr(self, "memoryview_bytes", False):  # Срезы не должны держать буфер `BytesIO`
+      view = memoryview(_read_encoded(buf)).toreadonly()
+      decode, tell = self._view_decoder(view, d, 0, allow_unknown)
+      return decode()
+    with getbuffer() as full, full.toreadonly() as view:
+      decode, tell = self._view_decoder(view, d, buf.tell(), allow_unknown)
+      try:
+        result = decode()
+      except IndexError:
+        raise ValueError("Unexpected end of data")
+      buf.seek(tell())
+    return result
+
+
+def _read_exact(buf: typing.IO[bytes], size: int) -> bytes:
+  data = buf.read(size)
+  if len(data) != size:
+    raise ValueError("Unexpected end of data")
+  return data
+
+
+def _read_encoded(buf: typing.IO[bytes]) -> bytearray:
+  """Прочитать из IO байты одного закодированного объекта, не декодируя его"""
+  result = bytearray()
+  left = 1  # Сколько объектов осталось прочитать
+  while left:
+    left -= 1
+    head = _read_exact(buf, 1)[0]
     typeid = head >> 4
-    sizesize = head & 0b1111
-    size = int.from_bytes(buf.read(sizesize), "big")
-    if typeid == 0:  # Специальный тип
-      return SPECIAL_TYPES[size]
+    raw_size = _read_exact(buf, head & 0b1111)
+    size = int.from_bytes(raw_size, "big")
+    result.append(head)
+    result.extend(raw_size)
     if typeid == 6:  # dict
-      result = {}
-      for i in range(size):
-        k = self.decode_obj(buf, d, allow_unknown)
-        result[k] = self.decode_obj(buf, d, allow_unknown)
-      return result
-    if typeid in (7, 8, 9):  # list, tuple, set
-      result = [self.decode_obj(buf, d, allow_unknown) for i in range(size)]
-      if typeid == 8:
-        return tuple(result)
-      if typeid == 9:
-        return set(result)
-      return result
-    if typeid == 12:  # datetime + timezone
-      dt: datetime.datetime = self.decode_obj(buf, d)
-      td: datetime.timedelta = self.decode_obj(buf, d)
-      return dt.replace(tzinfo=datetime.timezone(td))
-    if typeid == 14:  # Ссылка на словарь
-      return d[size]
-    if typeid == 15:  # Пользовательский тип
-      ctypename = self.custom_types[buf.read(1)[0]]
-      ctype = self.ms2dat.custom_types.get(ctypename)
-      cbody = buf.read(size)
-      if ctype is None:
-        if allow_unknown:
-          return UnknownType(ctypename, cbody)
-        raise ValueError(f"Unknown custom type: {ctypename}")
-      return ctype.decode_obj(self, cbody, d)
-    body = buf.read(size)
-    if typeid == 1:  # int
-      return int.from_bytes(body, "big")
-    if typeid == 2:  # int
-      return -int.from_bytes(body, "big")
-    if typeid == 3:  # float
-      return struct.unpack("d", body)[0]
-    if typeid == 4:  # bytes
-      return body
-    if typeid == 5:  # str
-      return body.decode("utf-8")
-    if typeid == 10:  # datetime
-      return datetime.datetime.fromtimestamp(struct.unpack("d", body)[0])
-    if typeid == 11:  # timedelta
-      return datetime.timedelta(seconds=struct.unpack("d", body)[0])
-    if typeid == 13:  # UUID
-      return uuid.UUID(bytes=body)
-    raise Exception("Эта ошибка никогда не вылезет")
+      left += size * 2
+    elif 7 <= typeid <= 9:  # list, tuple, set
+      left += size
+    elif typeid == 15:  # Пользовательский тип
+      result.extend(_read_exact(buf, 1 + size))
+    elif typeid not in (0, 14):
+      result.extend(_read_exact(buf, size))
+  return result
 
 
 class Writer:
@@ -187,7 +371,10 @@ class Writer:
     self.ms2dat = ms2dat
     self.obj = obj
     self.obj_dict: list[bytes] = []
+    self.obj_dict_index: dict[bytes, int] = {}  # собранный объект: номер в словаре
     self.used_ctypes: list[CustomType] = []
+    self.used_ctypes_index: dict[str, int] = {}  # имя типа: номер в used_ctypes
+    self.used_ctypes_frozen = False  # Заголовок уже записан, новые типы добавлять нельзя
 
   def _write(self, data: bytes):
     return self.f.write(data)
@@ -201,15 +388,18 @@ class Writer:
       return typeid, size, b""
     # В словаре только уже собранные объекты
     buf = bytes(self._build_obj(typeid, size, body))
-    if buf in self.obj_dict:
+    index = self.obj_dict_index.get(buf)
+    if index is not None:
       # Объект уже есть в словаре
-      return 14, self.obj_dict.index(buf), b""
-    if len(self.obj_dict) >= 0xffffff:
+      return 14, index, b""
+    index = len(self.obj_dict)
+    if index >= 0xffffff:
       # Словарь переполнен
       return typeid, size, body
     # Добавить объект в словарь
     self.obj_dict.append(buf)
-    return 14, len(self.obj_dict) - 1, b""
+    self.obj_dict_index[buf] = index
+    return 14, index, b""
 
   def _encode_obj(self, data, sort_keys: bool, use_dict: bool) -> tuple[int, int, bytes | bytearray]:
     for m, n in enumerate(SPECIAL_TYPES):
@@ -217,7 +407,7 @@ class Writer:
         if data is n:
           return 0, m, b""
       else:  # float
-        if data == n:
+        if isinstance(data, float) and data == n:
           return 0, m, b""
     if isinstance(data, int):
       typeid = 1
@@ -231,6 +421,8 @@ class Writer:
         return 0, 5, b""
       result = struct.pack("d", data)
       return 3, len(result), result
+    if isinstance(data, memoryview) and data.format in BYTES_FORMATS:
+      data = data.tobytes()  # Например, после загрузки с `memoryview_bytes`
     if isinstance(data, bytes):
       if use_dict:
         return self._addget_dict(4, len(data), data)
@@ -240,43 +432,22 @@ class Writer:
       if use_dict:
         return self._addget_dict(5, len(result), result)
       return 5, len(result), result
-    if isinstance(data, dict):
-      items = list(data.items())
-      if sort_keys:
-        try:
-          items.sort()
-        except Exception:
-          pass
+    if isinstance(data, CONTAINER_TYPES) and not isinstance(data, UnknownType):
+      typeid, size, items = self._container(data, sort_keys)
       buf = bytearray()
-      for k, v in items:
-        buf.extend(self.encode_obj(k, sort_keys, use_dict))
-        buf.extend(self.encode_obj(v, sort_keys, use_dict))
-      return 6, len(items), buf
-    if isinstance(data, (list, tuple, set)) and not isinstance(data, UnknownType):
-      typeid = 7
-      if isinstance(data, tuple):
-        typeid = 8
-      elif isinstance(data, set):
-        typeid = 9
-        if sort_keys:
-          try:
-            data = sorted(data)
-          except Exception:
-            pass
-      buf = bytearray()
-      for v in data:
-        buf.extend(self.encode_obj(v, sort_keys, use_dict))
-      return typeid, len(data), buf
+      for v in items:
+        self.encode_into(buf, v, sort_keys, use_dict)
+      return typeid, size, buf
     if isinstance(data, datetime.datetime):
       if data.tzinfo is None:
         result = struct.pack("d", data.timestamp())
         return 10, len(result), result
       td = data.tzinfo.utcoffset(data)
       if td is None:
-        return self._encode_obj(data.replace(tzinfo=None))
+        return self._encode_obj(data.replace(tzinfo=None), sort_keys, use_dict)
       buf = bytearray()
-      buf.extend(self.encode_obj(data.replace(tzinfo=None)))
-      buf.extend(self.encode_obj(td))
+      self.encode_into(buf, data.replace(tzinfo=None))
+      self.encode_into(buf, td)
       return 12, len(buf), buf
     if isinstance(data, datetime.timedelta):
       result = struct.pack("d", data.total_seconds())
@@ -291,17 +462,40 @@ class Writer:
       handler = self.ms2dat.find_handler(type(data))
     if handler is None:
       raise Exception(f"Unknown type: {type(data)}")
-    if handler in self.used_ctypes:
-      ctypeid = self.used_ctypes.index(handler)
-    else:
-      ctypeid = len(self.used_ctypes)
-      self.used_ctypes.append(handler)
+    ctypeid = self.used_ctypes_index.get(handler.typename)
+    if ctypeid is None:
+      if self.used_ctypes_frozen:
+        raise ValueError(f"Custom type {handler.typename} is not registered, it cannot be written in stream mode")
+      ctypeid = self._add_ctype(handler)
     body = handler.encode_obj(data, sort_keys)
     result = 15, len(body), bytes([ctypeid]) + body
     if use_dict and getattr(handler, "allow_dict", False):
       return self._addget_dict(*result)
     return result
 
+  def _array_typenames(self, obj) -> set[str]:
+    """Имена встроенных типов массивов (`ArrayType`, `NDArrayType`), которые понадобятся для объекта. Обход без кодирования"""
+    result = set()
+    stack = [obj]
+    while stack:
+      data = stack.pop()
+      if isinstance(data, dict):
+        stack.extend(data.keys())
+        stack.extend(data.values())
+      elif isinstance(data, CONTAINER_TYPES) and not isinstance(data, UnknownType):
+        stack.extend(data)
+      elif not (isinstance(data, memoryview) and data.format in BYTES_FORMATS):
+        handler = self.ms2dat.find_handler(type(data))
+        if isinstance(handler, (ArrayType, NDArrayType)):
+          result.add(handler.typename)
+    return result
+
+  def _add_ctype(self, handler: "CustomType") -> int:
+    ctypeid = len(self.used_ctypes)
+    self.used_ctypes.append(handler)
+    self.used_ctypes_index[handler.typename] = ctypeid
+    return ctypeid
+
   def _build_obj(self, typeid: int, size: int, body: bytes):
     sizesize = int_size_unsigned(size)
     if sizesize > 0b1111:
@@ -312,23 +506,121 @@ class Writer:
     buf.extend(body)
     return buf
 
-  def encode_obj(self, data, sort_keys=False, use_dict=True):
-    typeid, size, body = self._encode_obj(data, sort_keys, use_dict)
-    return self._build_obj(typeid, size, body)
+  def _container(self, data, sort_keys: bool) -> tuple[int, int, typing.Iterator]:
+    """Тип, количество элементов и итератор элементов контейнера. У `dict` ключи и значения идут по очереди"""
+    if isinstance(data, dict):
+      if sort_keys:
+        items = list(data.items())
+        try:
+          items.sort()
+        except Exception:
+          pass
+        return 6, len(items), chain.from_iterable(items)
+      return 6, len(data), chain.from_iterable(data.items())
+    typeid = 7
+    if isinstance(data, tuple):
+      typeid = 8
+    elif isinstance(data, set):
+      typeid = 9
+      if sort_keys:
+        try:
+          data = sorted(data)
+        except Exception:
+          pass
+    return typeid, len(data), iter(data)
+
+  def encode_into(self, out: bytearray, data, sort_keys=False, use_dict=True, flush: typing.Callable[[bytearray], typing.Any] = None):
+    """Кодировать объект в конец `out`. Вложенность не ограничена: в заголовке контейнера хранится количество элементов, поэтому он пишется сразу, а элементы берутся из стека итераторов. Если задан `flush`, он вызывается для `out` больше `STREAM_CHUNK_SIZE`, после чего `out` очищается"""
+    stack: list[typing.Iterator] = []
+    while True:
+      if isinstance(data, CONTAINER_TYPES) and not isinstance(data, UnknownType):
+        typeid, size, items = self._container(data, sort_keys)
+        stack.append(items)
+        body = b""
+      else:
+        typeid, size, body = self._encode_obj(data, sort_keys, use_dict)
+      sizesize = int_size_unsigned(size)
+      if sizesize > 0b1111:
+        raise Exception("Too big size")
+      out.append((typeid << 4) | sizesize)
+      out.extend(size.to_bytes(sizesize, "big"))
+      out.extend(body)
+      if flush is not None and len(out) >= STREAM_CHUNK_SIZE:
+        flush(out)
+        out.clear()
+      # Следующий элемент
+      while stack:
+        data = next(stack[-1], _MISSING)
+        if not data is _MISSING:
+          break
+        stack.pop()
+      else:
+        return out
 
-  def write_all(self, compress_type=0, encrypted=0, hash_type=1, sort_keys=False, use_dict=True):
-    self._write(MAGIC_HEAD)
-    self._write1(1)
-    # Сохранение объекта
-    raw_obj = self.encode_obj(self.obj, sort_keys, use_dict)
-    # Тело
+  def encode_obj(self, data, sort_keys=False, use_dict=True):
+    return self.encode_into(bytearray(), data, sort_keys, use_dict)
+
+  def build_body(self, obj, sort_keys=False, use_dict=True, workers=0):
+    """Собрать несжатое тело (словарь + объект). Словарь у каждого тела свой. При `workers` > 1 верхний `dict`/`list`/`tuple` кодируется частями в пуле процессов"""
+    self.obj_dict = []
+    self.obj_dict_index = {}
+    if workers > 1 and isinstance(obj, (dict, list, tuple)) and len(obj) >= workers * PARALLEL_SHARDS:
+      return self._build_body_parallel(obj, sort_keys, use_dict, workers)
+    if not use_dict:
+      # Пустой словарь, объект пишется сразу в тело
+      return self.encode_into(bytearray(3), obj, sort_keys, use_dict)
+    raw_obj = self.encode_obj(obj, sort_keys, use_dict)
     raw_body = bytearray()  # raw
     raw_body.extend(len(self.obj_dict).to_bytes(3, "big"))
     for i in self.obj_dict:
       raw_body.extend(i)
     raw_body.extend(raw_obj)
+    return raw_body
+
+  def _build_body_parallel(self, obj, sort_keys: bool, use_dict: bool, workers: int):
+    from concurrent.futures import ProcessPoolExecutor
+    typeid, size, items = self._container(obj, sort_keys)
+    items = list(items)
+    step = 2 if typeid == 6 else 1  # У dict ключ и значение не разделяются
+    shard_size = -(-size // (workers * PARALLEL_SHARDS)) * step
+    shards = [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.ms2dat,)) as pool:
+      results = list(pool.map(_encode_shard, shards, [sort_keys] * len(shards), [use_dict] * len(shards)))
+    # Сборка: словари частей идут подряд, ссылки и номера пользовательских типов сдвигаются
+    parts = []
+    for shard_dict, ctype_names, data in results:
+      ctype_map = []
+      for name in ctype_names:
+        ctypeid = self.used_ctypes_index.get(name)
+        if ctypeid is None:
+          handler = self.ms2dat.custom_types.get(name) or UnknownTypeHandler(self.ms2dat, name)
+          ctypeid = self._add_ctype(handler)
+        ctype_map.append(ctypeid)
+      shard_dict = [relocate_objects(i, 0, ctype_map) for i in shard_dict]
+      if len(self.obj_dict) + len(shard_dict) <= 0xffffff:
+        parts.append(relocate_objects(data, len(self.obj_dict), ctype_map))
+        self.obj_dict.extend(shard_dict)
+      else:
+        # Словарь переполнен, объекты из словаря части вставляются на место ссылок
+        parts.append(relocate_objects(data, 0, ctype_map, shard_dict))
+    raw_body = bytearray()  # raw
+    raw_body.extend(len(self.obj_dict).to_bytes(3, "big"))
+    for i in self.obj_dict:
+      raw_body.extend(i)
+    raw_body.extend(self._build_obj(typeid, size, b""))
+    for i in parts:
+      raw_body.extend(i)
+    return raw_body
+
+  def write_all(self, compress_type=0, encrypted=0, hash_type=1, sort_keys=False, use_dict=True, compress_level=None, compress_threads=0, workers=0):
+    if compress_type > 0b11:
+      raise ValueError(f"Compress type {compress_type} is not supported by MS2Dat v1")
+    self._write(MAGIC_HEAD)
+    self._write1(1)
+    # Тело
+    raw_body = self.build_body(self.obj, sort_keys, use_dict, workers)
     # Сжатие
-    compress_type, body = compress_data(compress_type, raw_body)  # compressed
+    compress_type, body = compress_data(compress_type, raw_body, compress_level, compress_threads)  # compressed
     # Шифрование
     encrypted = 1 if encrypted else 0  # Если дадут bool
     if encrypted:
@@ -352,6 +644,69 @@ class Writer:
     # Хеш
     self._write(hash_data(hash_type, raw_body))
 
+  def write_stream(self, compress_type=0, encrypted=0, hash_type=1, sort_keys=False, use_dict=True, compress_level=None, compress_threads=0):
+    """Записать объект, не собирая тело в памяти. Файл должен поддерживать `seek`. Словарь не используется, сжатие применяется всегда, в файле можно сохранить только зарегистрированные пользовательские типы. Шифрование идёт через `MS2Dat1.encryptor`"""
+    if compress_type > 0b11:
+      raise ValueError(f"Compress type {compress_type} is not supported by MS2Dat v1")
+    encrypted = 1 if encrypted else 0  # Если дадут bool
+    if not self.f.seekable():
+      raise ValueError("Stream mode requires a seekable file")
+    self._write(MAGIC_HEAD)
+    self._write1(1)
+    # Флаги (размер тела всегда занимает 7 байт и записывается в конце)
+    self._write1((compress_type << 6) | (hash_type << 4) | (encrypted << 3) | 0b111)
+    # Пользовательские типы известны заранее. Встроенные типы массивов объявляются, только если массивы есть в объекте
+    arrays = self._array_typenames(self.obj)
+    for i in self.ms2dat.custom_types.values():
+      if not isinstance(i, (ArrayType, NDArrayType)) or i.typename in arrays:
+        self._add_ctype(i)
+    self.used_ctypes_frozen = True
+    if len(self.used_ctypes) > 0xff:
+      raise Exception("Too many custom types")
+    self._write1(len(self.used_ctypes))
+    for i in self.used_ctypes:
+      name = i.typename.encode("utf-8")
+      self._write1(len(name))
+      self._write(name)
+    size_pos = self.f.tell()
+    self._write(bytes(7))
+    # Тело
+    compressor = get_compressor(compress_type, compress_level, compress_threads)
+    hasher = hashlib.new(HASH_NAMES[hash_type]) if hash_type else None
+    transform = self.ms2dat.encryptor() if encrypted else None
+    size = 0
+    buf = bytearray(3)  # Пустой словарь
+
+    def flush(data):
+      nonlocal size
+      if hasher is not None:
+        hasher.update(data)
+      if compressor is not None:
+        data = compressor.compress(data)
+      if transform is not None:
+        data = transform.update(data)
+      if data:
+        size += self._write(data)
+    self.encode_into(buf, self.obj, sort_keys, False, flush)
+    flush(buf)
+    tail = b""
+    if compressor is not None:
+      tail = compressor.flush()
+    if transform is not None:
+      tail = transform.update(tail) + transform.finalize()
+    if tail:
+      size += self._write(tail)
+    if int_size_unsigned(size) > 0b111:
+      raise Exception("Too big body")
+    # Размер тела
+    end_pos = self.f.tell()
+    self.f.seek(size_pos)
+    self._write(size.to_bytes(7, "big"))
+    self.f.seek(end_pos)
+    # Хеш
+    if hasher is not None:
+      self._write(hasher.digest())
+
 
 class CustomType:
   allow_dict: bool
@@ -383,6 +738,215 @@ class UnknownTypeHandler(CustomType):
     return data.body
 
 
+class ArrayType(CustomType):
+  """Упакованный `array.array` (и одномерный `memoryview` с числовым форматом, кроме `BYTES_FORMATS`): код типа, размер элемента, данные в little-endian"""
+  allow_dict = False
+  handled_types = {array.array, memoryview}
+  typename = "ms2.array"
+  INT_CODES = "bhilq", "BHILQ"
+
+  def encode_obj(self, data: array.array | memoryview, sort_keys=False):
+    if isinstance(data, memoryview):
+      if not data.format in array.typecodes:
+        raise ValueError(f"Unsupported memoryview format: {data.format}")
+      if data.ndim > 1:  # Форма не сохраняется
+        raise ValueError(f"Multi-dimensional memoryview is not supported (shape {data.shape}), use numpy.ndarray")
+      arr = array.array(data.format)
+      arr.frombytes(data.cast("B"))
+      data = arr
+    if sys.byteorder == "big":
+      data = array.array(data.typecode, data)
+      data.byteswap()
+    return data.typecode.encode("ascii") + bytes([data.itemsize]) + data.tobytes()
+
+  def decode_obj(self, reader: Reader, body: bytes, d: list):
+    typecode = chr(body[0])
+    itemsize = body[1]
+    if array.array(typecode).itemsize != itemsize:
+      # Размер long отличается на разных платформах
+      for codes in self.INT_CODES:
+        if typecode in codes:
+          typecode = [i for i in codes if array.array(i).itemsize == itemsize][0]
+          break
+      else:
+        raise ValueError(f"Unsupported array item size: {typecode}{itemsize}")
+    result = array.array(typecode)
+    result.frombytes(body[2:])
+    if sys.byteorder == "big":
+      result.byteswap()
+    return result
+
+
+class NDArrayType(CustomType):
+  """Упакованный `numpy.ndarray`: dtype, форма, данные одним буфером | numpy"""
+  allow_dict = False
+  typename = "ms2.ndarray"
+
+  @property
+  def handled_types(self):
+    # numpy не импортируется ради проверки типа: если модуля нет, то массивов тоже нет
+    if "numpy" in sys.modules:
+      return {sys.modules["numpy"].ndarray}
+    return set()
+
+  def encode_obj(self, data, sort_keys=False):
+    import numpy
+    if data.dtype.hasobject:
+      raise ValueError("Arrays of Python objects are not supported")
+    dtype = data.dtype.str.encode("ascii")
+    buf = bytearray()
+    buf.append(len(dtype))
+    buf.extend(dtype)
+    buf.append(data.ndim)
+    for i in data.shape:
+      buf.extend(i.to_bytes(8, "big"))
+    buf.extend(numpy.ascontiguousarray(data).tobytes())
+    return buf
+
+  def decode_obj(self, reader: Reader, body: bytes, d: list):
+    import numpy
+    pos = body[0] + 1
+    dtype = numpy.dtype(body[1:pos].decode("ascii"))
+    shape = [int.from_bytes(body[pos + 1 + i * 8:pos + 9 + i * 8], "big") for i in range(body[pos])]
+    pos += 1 + len(shape) * 8
+    return numpy.frombuffer(body, dtype, offset=pos).reshape(shape).copy()
+
+
+class BodyTransform:
+  """Потоковое преобразование тела (шифрование/расшифровка): `update` для каждой порции, `finalize` в конце"""
+
+  def update(self, data: bytes) -> bytes:
+    raise NotImplementedError()
+
+  def finalize(self) -> bytes:
+    return b""
+
+
+class BufferedTransform(BodyTransform):
+  """Накапливает тело и преобразует его целиком в `finalize`"""
+
+  def __init__(self, func: typing.Callable[[bytes], bytes]):
+    self.buf = bytearray()
+    self.func = func
+
+  def update(self, data: bytes):
+    self.buf.extend(data)
+    return b""
+
+  def finalize(self):
+    data = bytes(self.buf)
+    self.buf = bytearray()
+    return self.func(data)
+
+
+class XorTransform(BodyTransform):
+  """XOR с повторяющимся ключом. Порция обрабатывается как одно большое число, а не по байту"""
+
+  def __init__(self, key: bytes):
+    self.key = bytes(key)
+    self.pos = 0
+
+  def update(self, data: bytes):
+    size = len(data)
+    if size == 0:
+      return b""
+    key = self.key
+    start = self.pos % len(key)
+    stream = (key[start:] + key * (size // len(key) + 1))[:size]
+    self.pos += size
+    return (int.from_bytes(data, "little") ^ int.from_bytes(stream, "little")).to_bytes(size, "little")
+
+
+class GCMEncryptTransform(BodyTransform):
+  """Потоковое шифрование AES-GCM в формате `MS2Dat1Cipher` | cryptography"""
+
+  def __init__(self, key: bytes):
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    self.nonce = secrets.token_bytes(12)
+    self.ctx = Cipher(algorithms.AES(key), modes.GCM(self.nonce)).encryptor()
+    self.prefix = self.nonce
+
+  def _add_prefix(self, data: bytes):
+    if self.prefix:
+      data = self.prefix + data
+      self.prefix = b""
+    return data
+
+  def update(self, data: bytes):
+    return self._add_prefix(self.ctx.update(data))
+
+  def finalize(self):
+    data = self.ctx.finalize()
+    return self._add_prefix(data + self.ctx.tag)
+
+
+def relocate_objects(data: bytes, ref_offset: int, ctype_map: list[int], inline: list[bytes] = None) -> bytes | bytearray:
+  """Сдвинуть ссылки на словарь на `ref_offset` и заменить номера пользовательских типов по `ctype_map` в подряд идущих закодированных объектах. Если задан `inline`, ссылки заменяются объектами из него"""
+  if ref_offset == 0 and inline is None and ctype_map == list(range(len(ctype_map))):
+    return data
+  view = memoryview(data)
+  from_bytes = int.from_bytes
+  result = bytearray()
+  last = 0
+  pos = 0
+  end = len(view)
+  while pos < end:
+    start = pos
+    head = view[pos]
+    typeid = head >> 4
+    sizesize = head & 0b1111
+    pos += 1 + sizesize
+    size = from_bytes(view[start + 1:pos], "big")
+    if typeid == 14:  # Ссылка на словарь
+      result.extend(view[last:start])
+      if inline is None:
+        size += ref_offset
+        sizesize = int_size_unsigned(size)
+        result.append((14 << 4) | sizesize)
+        result.extend(size.to_bytes(sizesize, "big"))
+      else:
+        result.extend(inline[size])
+      last = pos
+    elif typeid == 15:  # Пользовательский тип
+      ctypeid = ctype_map[view[pos]]
+      if ctypeid != view[pos]:
+        result.extend(view[last:pos])
+        result.append(ctypeid)
+        last = pos + 1
+      pos += 1 + size
+    elif not typeid in NO_BODY_TYPES:
+      pos += size
+  result.extend(view[last:])
+  return result
+
+
+_worker_ms2dat: "MS2Dat1" = None
+
+
+def _init_worker(ms2dat: "MS2Dat1"):
+  global _worker_ms2dat
+  _worker_ms2dat = ms2dat
+
+
+def _encode_shard(items: list, sort_keys: bool, use_dict: bool):
+  """Кодирование части верхнего контейнера в процессе пула. Возвращает словарь части, имена пользовательских типов и объекты"""
+  writer = Writer(_worker_ms2dat, None, None)
+  buf = bytearray()
+  for i in items:
+    writer.encode_into(buf, i, sort_keys, use_dict)
+  return writer.obj_dict, [i.typename for i in writer.used_ctypes], buf
+
+
+def transform_data(transform: BodyTransform, data: bytes) -> bytes:
+  """Преобразовать данные целиком, порциями по `STREAM_CHUNK_SIZE`"""
+  view = memoryview(data)
+  result = bytearray()
+  for i in range(0, len(view), STREAM_CHUNK_SIZE):
+    result.extend(transform.update(view[i:i + STREAM_CHUNK_SIZE]))
+  result.extend(transform.finalize())
+  return bytes(result)
+
+
 class MS2Dat1:
   VERSION = 1
   COMPRESS_NONE = 0
@@ -398,14 +962,19 @@ class MS2Dat1:
     self._dump_kw = {}
     self._load_kw = {}
     self.custom_types: dict[str, CustomType] = {}
+    self._handler_cache: dict[type, CustomType | None] = {}
+    self.reg_custom_type(ArrayType(self))
+    self.reg_custom_type(NDArrayType(self))
 
   def set_allow_unknown(self, value: bool):
     """Разрешить загрузку неизвестных пользовательских типов? Такие объекты будут загружены в виде `UnknownType`"""
     self._load_kw["allow_unknown"] = bool(value)
 
-  def set_compress(self, value: int):
-    """Уровень сжатия (см. константы класса)"""
+  def set_compress(self, value: int, level: int = None, threads: int = 0):
+    """Алгоритм сжатия (см. константы класса). `level=None` - уровень по умолчанию для алгоритма, `threads` - потоки для zstd (0 - без потоков, -1 - по количеству ядер)"""
     self._dump_kw["compress_type"] = value
+    self._dump_kw["compress_level"] = level
+    self._dump_kw["compress_threads"] = threads
 
   def set_encrypt(self, value: bool):
     """Включить шифрование? Шифрование должно быть реализовано подклассом"""
@@ -415,6 +984,22 @@ class MS2Dat1:
     """Алгоритм хеширования (см. константы класса)"""
     self._dump_kw["hash_type"] = value
 
+  def set_workers(self, value: int):
+    """Кол-во процессов для кодирования верхнего `dict`/`list` (0 - без пула). Объект и пользовательские типы должны поддерживать `pickle`"""
+    self._dump_kw["workers"] = value
+
+  def set_stream(self, value: bool):
+    """Сохранять в потоковом режиме? Экономит память на больших объектах, но отключает словарь"""
+    self._dump_kw["stream"] = bool(value)
+
+  def set_intern_strings(self, value: bool):
+    """Загружать одинаковые короткие `str` и `bytes` (ключи словарей и т.п.) одним общим объектом? Экономит память на однотипных записях"""
+    self._load_kw["intern_strings"] = bool(value)
+
+  def set_memoryview_bytes(self, value: bool):
+    """Загружать `bytes` в виде `memoryview` без копирования? Срезы держат в памяти всё тело файла"""
+    self._load_kw["memoryview_bytes"] = bool(value)
+
   def set_sort_keys(self, value: bool):
     """Сортировать ключи `dict` и `set`?"""
     self._dump_kw["sort_keys"] = bool(value)
@@ -459,6 +1044,7 @@ class MS2Dat1:
     if (obj.typename in self.custom_types) and not replace:
       raise Exception(f"Type {obj.typename} already registered")
     self.custom_types[obj.typename] = obj
+    self._handler_cache.clear()
 
   def reg_custom_type_deco(self, replace=False):
     """Регистрация пользовательского типа в виде декоратора над классом"""
@@ -468,10 +1054,19 @@ class MS2Dat1:
     return deco
 
   def find_handler(self, cls: type) -> CustomType | None:
-    """Найти обработчик для типа данных (только пользовательские типы)"""
-    for i in self.custom_types.values():
-      if cls in i.handled_types:
-        return i
+    """Найти обработчик для типа данных (только пользовательские типы). Подклассы ищутся по MRO, результат кешируется до следующей регистрации типа"""
+    if cls in self._handler_cache:
+      return self._handler_cache[cls]
+    result = None
+    for base in cls.__mro__:
+      for i in self.custom_types.values():
+        if base in i.handled_types:
+          result = i
+          break
+      if result is not None:
+        break
+    self._handler_cache[cls] = result
+    return result
 
   def decrypt_body(self, data: bytes) -> bytes:
     """Расшифровать тело. Должен быть переопределен для работы"""
@@ -481,12 +1076,24 @@ class MS2Dat1:
     """Зашифровать тело. Должен быть переопределен для работы"""
     raise NotImplementedError("This class cannot work with encryption")
 
+  def decryptor(self) -> "BodyTransform":
+    """Потоковая расшифровка тела. По умолчанию тело накапливается и расшифровывается через `decrypt_body`"""
+    return BufferedTransform(self.decrypt_body)
+
+  def encryptor(self) -> "BodyTransform":
+    """Потоковое шифрование тела. По умолчанию тело накапливается и шифруется через `encrypt_body`"""
+    return BufferedTransform(self.encrypt_body)
+
   def dump(self, obj, file: typing.BinaryIO, **kw):
-    """Сохранить объект в IO"""
+    """Сохранить объект в IO. При `stream=True` тело не собирается в памяти (см. `Writer.write_stream`)"""
     writer = Writer(self, file, obj)
     for k, v in self._dump_kw.items():
       kw.setdefault(k, v)
-    writer.write_all(**kw)
+    if kw.pop("stream", False):
+      kw.pop("workers", None)  # Потоковая запись идёт по порядку
+      writer.write_stream(**kw)
+    else:
+      writer.write_all(**kw)
 
   def dumps(self, obj, **kw):
     """Сохранить объект в `bytes`"""
@@ -540,11 +1147,50 @@ class MS2Dat1EncryptExample(MS2Dat1):
 
   def decrypt_body(self, data: bytes):
     """Зашифровать/расшифровать данные, используя XOR-шифрование"""
-    key = self.encrypt_key
-    lkey = len(key)
-    return bytes([b ^ key[i % lkey] for i, b in enumerate(data)])
+    return transform_data(XorTransform(self.encrypt_key), data)
   encrypt_body = decrypt_body
 
+  def encryptor(self):
+    return XorTransform(self.encrypt_key)
+  decryptor = encryptor
+
+
+class MS2Dat1Cipher(MS2Dat1):
+  """Шифрование AES-GCM или ChaCha20-Poly1305. Зашифрованное тело: nonce (12 байт), шифротекст, тег (16 байт) | cryptography"""
+  ALGORITHMS = "aes-gcm", "chacha20-poly1305"
+
+  def __init__(self, key: bytes, algorithm: str = "aes-gcm"):
+    super().__init__()
+    if not algorithm in self.ALGORITHMS:
+      raise ValueError(f"Unknown algorithm: {algorithm}")
+    self.algorithm = algorithm
+    self.encrypt_key = key
+
+  @classmethod
+  def create_with_random_key(cls, keysize=32, algorithm: str = "aes-gcm"):
+    return cls(secrets.token_bytes(keysize), algorithm)
+
+  def _aead(self):
+    if self.algorithm == "aes-gcm":
+      from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+      return AESGCM(self.encrypt_key)
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+    return ChaCha20Poly1305(self.encrypt_key)
+
+  def decrypt_body(self, data: bytes):
+    data = bytes(data)
+    return self._aead().decrypt(data[:12], data[12:], None)
+
+  def encrypt_body(self, data: bytes):
+    nonce = secrets.token_bytes(12)
+    return nonce + self._aead().encrypt(nonce, bytes(data), None)
+
+  def encryptor(self):
+    if self.algorithm == "aes-gcm":
+      return GCMEncryptTransform(self.encrypt_key)
+    # ChaCha20-Poly1305 в cryptography не поддерживает потоковую работу
+    return super().encryptor()
+
 
 inst = MS2Dat1()
 """Настройки по умолчанию"""
@@ -0,0 +1,447 @@
+"""MS2Dat v2: элементы верхнего `dict`/`list` хранятся отдельными кадрами с индексом в конце файла, что позволяет загружать их по одному"""
+import bisect
+import builtins
+import hashlib
+import mmap
+import struct
+import typing
+from collections.abc import Mapping, Sequence
+from functools import cached_property
+from MainShortcuts2 import ms2dat1
+from MainShortcuts2.ms2dat1 import HASH_SIZES, MAGIC_HEAD, FileHeader, compress_data, decompress_data, hash_data
+# Файл:
+# MAGIC_HEAD, версия (1), флаги (1), тип корня (1). Тип сжатия хранится у каждого кадра, поэтому доступны все алгоритмы
+# Кадры: тело v1 (словарь + список элементов), сжатое и зашифрованное отдельно, + хеш несжатого тела
+# Индекс: пользовательские типы, кол-во элементов (8), размер тела с ключами (8), тело с ключами, [таблица ключей], таблица кадров
+# Хеш индекса, позиция индекса (8)
+# Таблица ключей (если в флагах есть FLAG_KEY_TABLE): записи KEY_ENTRY, отсортированные по хешу ключа
+ENTRY = struct.Struct(">BQQQ")  # Тип сжатия, позиция, размер кадра, кол-во элементов в кадре
+FLAG_KEY_TABLE = 1
+FRAME_SIZE = 2**14  # Мелкие элементы объединяются в кадры примерно такого размера
+KEY_ENTRY = struct.Struct(">QQQ")  # Хеш ключа, позиция ключа в теле с ключами, номер элемента
+ROOT_OBJECT = 0
+ROOT_DICT = 1
+ROOT_LIST = 2
+VERSION = 2
+
+
+def key_hash(key) -> int | None:
+  """64-битный хеш ключа для таблицы ключей. Равные ключи (`1`, `1.0`, `True`) дают одинаковый хеш. `None`, если тип ключа не поддерживается"""
+  if isinstance(key, str):
+    data = b"s" + key.encode("utf-8", "surrogatepass")
+  elif isinstance(key, bytes):
+    data = b"b" + key
+  elif isinstance(key, (int, float)):
+    if isinstance(key, float) and not key.is_integer():
+      data = b"f" + struct.pack(">d", key)
+    else:
+      data = b"i" + str(int(key)).encode("ascii")
+  else:
+    return None
+  return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+class Writer:
+  """v2"""
+
+  def __init__(self, ms2dat: "MS2Dat2", f: typing.IO[bytes], obj):
+    self.encoder = ms2dat1.Writer(ms2dat, f, None)
+    self.f = f
+    self.ms2dat = ms2dat
+    self.obj = obj
+    self.pos = 0
+    self.table = bytearray()
+    self._reset_frame()
+
+  def _write(self, data: bytes):
+    self.f.write(data)
+    self.pos += len(data)
+
+  def _reset_frame(self):
+    self.encoder.obj_dict = []
+    self.encoder.obj_dict_index = {}
+    self.frame_buf = bytearray()
+    self.frame_count = 0
+    self.frame_dict_size = 0
+
+  def add(self, obj):
+    """Добавить элемент в текущий кадр. Кадр записывается, когда его размер превысит `frame_size`"""
+    kw = self.frame_kw
+    dict_len = len(self.encoder.obj_dict)
+    self.encoder.encode_into(self.frame_buf, obj, kw["sort_keys"], kw["use_dict"])
+    for i in range(dict_len, len(self.encoder.obj_dict)):
+      self.frame_dict_size += len(self.encoder.obj_dict[i])
+    self.frame_count += 1
+    if len(self.frame_buf) + self.frame_dict_size >= kw["frame_size"]:
+      self.write_frame()
+
+  def write_frame(self):
+    """Записать текущий кадр и добавить его в таблицу кадров"""
+    if self.frame_count == 0:
+      return
+    kw = self.frame_kw
+    raw_body = bytearray()  # raw
+    raw_body.extend(len(self.encoder.obj_dict).to_bytes(3, "big"))
+    for i in self.encoder.obj_dict:
+      raw_body.extend(i)
+    raw_body.extend(self.encoder._build_obj(7, self.frame_count, b""))
+    raw_body.extend(self.frame_buf)
+    frame_compress, body = compress_data(kw["compress_type"], raw_body, kw["compress_level"], kw["compress_threads"])
+    if kw["encrypted"]:
+      body = self.ms2dat.encrypt_body(body)
+    offset = self.pos
+    self._write(body)
+    self._write(hash_data(kw["hash_type"], raw_body))
+    self.table.extend(ENTRY.pack(frame_compress, offset, len(body), self.frame_count))
+    self._reset_frame()
+
+  def write_all(self, compress_type=0, encrypted=0, hash_type=1, sort_keys=False, use_dict=True, compress_level=None, compress_threads=0, frame_size=FRAME_SIZE):
+    encrypted = 1 if encrypted else 0  # Если дадут bool
+    self.frame_kw = {"compress_type": compress_type, "encrypted": encrypted, "hash_type": hash_type, "sort_keys": sort_keys, "use_dict": use_dict, "compress_level": compress_level, "compress_threads": compress_threads, "frame_size": frame_size}
+    keys = []
+    if isinstance(self.obj, dict):
+      root = ROOT_DICT
+      keys = list(self.obj)
+      if sort_keys:
+        try:
+          keys.sort()
+        except Exception:
+          pass
+      values = (self.obj[k] for k in keys)
+      count = len(keys)
+    elif isinstance(self.obj, list):
+      root = ROOT_LIST
+      values = self.obj
+      count = len(self.obj)
+    else:
+      root = ROOT_OBJECT
+      values = [self.obj]
+      count = 1
+    # Хеши ключей нужны до записи флагов
+    hashes = [key_hash(k) for k in keys]
+    flags = (hash_type << 4) | (encrypted << 3)
+    if root == ROOT_DICT and not None in hashes:
+      flags |= FLAG_KEY_TABLE
+    self._write(MAGIC_HEAD)
+    self._write(bytes([VERSION, flags, root]))
+    # Кадры
+    for v in values:
+      self.add(v)
+    self.write_frame()
+    # Индекс
+    raw_keys = bytearray()
+    key_table = bytearray()
+    if root == ROOT_DICT:
+      raw_keys.extend(bytes(3))  # Пустой словарь
+      raw_keys.extend(self.encoder._build_obj(7, count, b""))
+      entries = []
+      for num, k in enumerate(keys):
+        entries.append((hashes[num], len(raw_keys), num))
+        self.encoder.encode_into(raw_keys, k, False, False)
+      if flags & FLAG_KEY_TABLE:
+        entries.sort()
+        for i in entries:
+          key_table.extend(KEY_ENTRY.pack(*i))
+    if len(self.encoder.used_ctypes) > 0xff:
+      raise Exception("Too many custom types")
+    index = bytearray()
+    index.append(len(self.encoder.used_ctypes))
+    for i in self.encoder.used_ctypes:
+      name = i.typename.encode("utf-8")
+      index.append(len(name))
+      index.extend(name)
+    index.extend(count.to_bytes(8, "big"))
+    index.extend(len(raw_keys).to_bytes(8, "big"))
+    index.extend(raw_keys)
+    index.extend(key_table)
+    index.extend(self.table)
+    index_offset = self.pos
+    self._write(index)
+    self._write(hash_data(hash_type, index))
+    self._write(index_offset.to_bytes(8, "big"))
+
+
+class FrameReader(ms2dat1.Reader):
+  """Декодер тел кадров. В отличие от v1 не читает заголовок из файла"""
+
+  def __init__(self, ms2dat: "MS2Dat2", custom_types: list[str], allow_unknown=False, memoryview_bytes=False, intern_strings=False):
+    self.allow_unknown = allow_unknown
+    self.custom_types = custom_types
+    self.intern_cache = {} if intern_strings else None  # Общий для всех кадров
+    self.memoryview_bytes = memoryview_bytes
+    self.ms2dat = ms2dat
+
+
+class Reader:
+  """v2. Работает с буфером всего файла (`bytes` или `mmap`), кадры читаются по требованию"""
+
+  def __init__(self, ms2dat: "MS2Dat2", buf: bytes | mmap.mmap, allow_unknown=False, verify=True, memoryview_bytes=False, intern_strings=False):
+    self.buf = buf
+    self.ms2dat = ms2dat
+    self.verify = verify
+    if buf[:4] != MAGIC_HEAD or buf[4] != VERSION:
+      raise ValueError("Invalid file header")
+    flags = buf[5]
+    self.hash_type = flags >> 4 & 0b11
+    self.encrypted = flags >> 3 & 1
+    self.has_key_table = bool(flags & FLAG_KEY_TABLE)
+    self.root = buf[6]
+    self.hash_size = HASH_SIZES[self.hash_type]
+    # Индекс
+    end = len(buf) - 8
+    index_offset = int.from_bytes(buf[end:], "big")
+    index_end = end - self.hash_size
+    if not 7 <= index_offset <= index_end:
+      raise ValueError("The file is corrupted")
+    index = buf[index_offset:index_end]
+    if verify and self.hash_type:
+      if hash_data(self.hash_type, index) != buf[index_end:end]:
+        raise ValueError("The file is corrupted")
+    custom_types: list[str] = []
+    pos = 1
+    for i in range(index[0]):
+      size = index[pos]
+      custom_types.append(index[pos + 1:pos + 1 + size].decode("utf-8"))
+      pos += 1 + size
+    self.frame_reader = FrameReader(ms2dat, custom_types, allow_unknown, memoryview_bytes, intern_strings)
+    self.count = int.from_bytes(index[pos:pos + 8], "big")
+    keys_size = int.from_bytes(index[pos + 8:pos + 16], "big")
+    pos += 16
+    # Ключи декодируются только при обращении к `keys`, поиск ключа идёт по таблице ключей
+    self.keys_pos = pos
+    self.keys_size = keys_size
+    pos += keys_size
+    self.key_table_pos = pos
+    if self.has_key_table:
+      pos += self.count * KEY_ENTRY.size
+    self.index = index
+    self.table_pos = pos
+    if (len(index) - pos) % ENTRY.size:
+      raise ValueError("The file is corrupted")
+    self.frames = (len(index) - pos) // ENTRY.size
+    self.frame_starts: list[int] = []  # Номер первого элемента в каждом кадре
+    total = 0
+    for i in range(self.frames):
+      self.frame_starts.append(total)
+      total += ENTRY.unpack_from(index, pos + i * ENTRY.size)[3]
+    if total != self.count:
+      raise ValueError("The file is corrupted")
+
+  @cached_property
+  def keys(self) -> list:
+    """Все ключи верхнего `dict` по порядку"""
+    if self.root != ROOT_DICT:
+      return []
+    return self.frame_reader.decode_body(self.index[self.keys_pos:self.keys_pos + self.keys_size])
+
+  @cached_property
+  def key2num(self) -> dict:
+    """Номера элементов по ключам"""
+    return {k: n for n, k in enumerate(self.keys)}
+
+  def find_key(self, key) -> int | None:
+    """Номер элемента по ключу верхнего `dict`. Если есть таблица ключей, в ней ищется хеш ключа и декодируются только ключи с таким хешем"""
+    if self.root != ROOT_DICT:
+      return None
+    digest = key_hash(key) if self.has_key_table else None
+    if digest is None:
+      return self.key2num.get(key)
+    lo = 0
+    hi = self.count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if KEY_ENTRY.unpack_from(self.index, self.key_table_pos + mid * KEY_ENTRY.size)[0] < digest:
+        lo = mid + 1
+      else:
+        hi = mid
+    for i in range(lo, self.count):
+      h, offset, num = KEY_ENTRY.unpack_from(self.index, self.key_table_pos + i * KEY_ENTRY.size)
+      if h != digest:
+        break
+      if self.frame_reader.decode_view(memoryview(self.index), self.keys_pos + offset, [])[0] == key:
+        return num
+    return None
+
+  def find_frame(self, num: int) -> int:
+    """Номер кадра, в котором лежит элемент"""
+    if not 0 <= num < self.count:
+      raise IndexError("Element number out of range")
+    return bisect.bisect_right(self.frame_starts, num) - 1
+
+  def read_frame(self, num: int) -> list:
+    """Загрузить список элементов кадра"""
+    if not 0 <= num < self.frames:
+      raise IndexError("Frame number out of range")
+    compress_type, offset, size, count = ENTRY.unpack_from(self.index, self.table_pos + num * ENTRY.size)
+    body = self.buf[offset:offset + size]  # compressed,encrypted
+    if self.encrypted:
+      body = self.ms2dat.decrypt_body(body)  # compressed
+    raw_body = decompress_data(compress_type, body)  # raw
+    if self.verify and self.hash_type:
+      end = offset + size
+      if hash_data(self.hash_type, raw_body) != self.buf[end:end + self.hash_size]:
+        raise ValueError("The file is corrupted")
+    result = self.frame_reader.decode_body(raw_body)
+    if not isinstance(result, list) or len(result) != count:
+      raise ValueError("The file is corrupted")
+    return result
+
+  def read_item(self, num: int):
+    """Загрузить элемент по номеру"""
+    frame = self.find_frame(num)
+    return self.read_frame(frame)[num - self.frame_starts[frame]]
+
+  def read_all(self):
+    """Загрузить весь объект"""
+    values = []
+    for i in range(self.frames):
+      values.extend(self.read_frame(i))
+    if self.root == ROOT_DICT:
+      return dict(zip(self.keys, values))
+    if self.root == ROOT_LIST:
+      return values
+    return values[0]
+
+
+class _LazyBase:
+  def __init__(self, reader: Reader, f: typing.IO[bytes] = None, cache=True):
+    self._cache: dict[int, list] | None = {} if cache else None  # номер кадра: элементы
+    self._f = f
+    self._reader = reader
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *a):
+    self.close()
+
+  def __len__(self):
+    return self._reader.count
+
+  def _get(self, num: int):
+    if self._cache is None:
+      return self._reader.read_item(num)
+    frame = self._reader.find_frame(num)
+    if not frame in self._cache:
+      self._cache[frame] = self._reader.read_frame(frame)
+    return self._cache[frame][num - self._reader.frame_starts[frame]]
+
+  def close(self):
+    """Закрыть файл"""
+    buf = self._reader.buf
+    if isinstance(buf, mmap.mmap):
+      buf.close()
+    if self._f is not None:
+      self._f.close()
+
+  def load_all(self):
+    """Загрузить все элементы"""
+    return self._reader.read_all()
+
+
+class LazyDict(_LazyBase, Mapping):
+  """Словарь из файла MS2Dat v2, значения загружаются при обращении"""
+
+  def __contains__(self, k):
+    return self._reader.find_key(k) is not None
+
+  def __getitem__(self, k):
+    num = self._reader.find_key(k)
+    if num is None:
+      raise KeyError(k)
+    return self._get(num)
+
+  def __iter__(self):
+    return iter(self._reader.keys)
+
+
+class LazyList(_LazyBase, Sequence):
+  """Список из файла MS2Dat v2, элементы загружаются при обращении"""
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self._get(n) for n in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError("list index out of range")
+    return self._get(i)
+
+
+class MS2Dat2(ms2dat1.MS2Dat1):
+  VERSION = VERSION
+  COMPRESS_ZSTD = 4  # zstandard
+  COMPRESS_LZ4 = 5  # lz4
+
+  def profile_smaller_size(self):
+    """Сильное сжатие zstd (уровень 19, потоки по количеству ядер) с быстрой распаковкой. Без `zstandard` - LZMA, как в v1"""
+    import importlib.util
+    if importlib.util.find_spec("zstandard") is None:
+      return ms2dat1.MS2Dat1.profile_smaller_size(self)
+    self.set_compress(self.COMPRESS_ZSTD, 19, -1)
+
+  def set_frame_size(self, value: int):
+    """Примерный размер кадра (байт). Меньше - быстрее доступ к одному элементу, больше - меньше размер файла"""
+    self._dump_kw["frame_size"] = value
+
+  def dump(self, obj, file: typing.BinaryIO, **kw):
+    """Сохранить объект в IO. Тело собирается в памяти только для одного кадра"""
+    writer = Writer(self, file, obj)
+    for k, v in self._dump_kw.items():
+      kw.setdefault(k, v)
+    kw.pop("stream", None)  # v2 всегда пишет по кадрам
+    kw.pop("workers", None)  # Кадры кодируются по очереди
+    writer.write_all(**kw)
+
+  def load(self, file: typing.BinaryIO, *, _h: FileHeader = None, **kw):
+    """Загрузить объект из IO"""
+    if _h is None:
+      _h = FileHeader.from_file(file)
+    if _h.version != self.VERSION:
+      raise Exception(f"Unsupported version {_h.version}")
+    for k, v in self._load_kw.items():
+      kw.setdefault(k, v)
+    return Reader(self, _h.build() + file.read(), **kw).read_all()
+
+  def read_file(self, path, **kw):
+    """Загрузить объект из локального файла"""
+    data = self.open_file(path, cache=False, **kw)
+    if isinstance(data, _LazyBase):
+      with data:
+        return data.load_all()
+    return data
+
+  def open_file(self, path, cache=True, **kw) -> LazyDict | LazyList | typing.Any:
+    """Открыть локальный файл через `mmap`. Верхний `dict`/`list` возвращается как `LazyDict`/`LazyList`, остальные объекты загружаются сразу"""
+    for k, v in self._load_kw.items():
+      kw.setdefault(k, v)
+    f = builtins.open(path, "rb")
+    try:
+      buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        reader = Reader(self, buf, **kw)
+        if reader.root == ROOT_DICT:
+          return LazyDict(reader, f, cache)
+        if reader.root == ROOT_LIST:
+          return LazyList(reader, f, cache)
+        result = reader.read_all()
+      except BaseException:
+        buf.close()
+        raise
+    except BaseException:
+      f.close()
+      raise
+    buf.close()
+    f.close()
+    return result
+
+
+inst = MS2Dat2()
+"""Настройки по умолчанию"""
+dump = inst.dump
+dumps = inst.dumps
+load = inst.load
+loads = inst.loads
+open_file = inst.open_file
+read_file = inst.read_file
+write_file = inst.write_file
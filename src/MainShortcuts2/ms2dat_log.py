@@ -0,0 +1,197 @@
+"""Журнал записей MS2Dat: файл, в конец которого дописываются объекты, без перезаписи всего файла"""
+import builtins
+import os
+import struct
+import time
+import typing
+from MainShortcuts2.core import ms
+from MainShortcuts2.ms2dat1 import HASH_SIZES, MS2Dat1, Writer, compress_data, decompress_data, hash_data
+from MainShortcuts2.ms2dat2 import FrameReader
+# Файл:
+# MAGIC_HEAD, версия (1)
+# Записи: заголовок (тип сжатия, флаги, размер данных), данные, хеш
+# Данные: пользовательские типы, тело v1 (словарь + объект), сжатые и зашифрованные
+MAGIC_HEAD = b"MS2L"
+RECORD_HEAD = struct.Struct(">BBQ")  # Тип сжатия, хеш<<4 | шифрование<<3, размер данных
+VERSION = 1
+FILE_HEAD = MAGIC_HEAD + bytes([VERSION])
+
+
+class RecordLog(ms.ObjectBase):
+  """Журнал записей. `append` дописывает объект в конец файла, `iter_records` лениво читает записи, начиная с любой позиции.
+  Настройки сжатия, хеширования и шифрования берутся из `ms2dat` (как у `dump`) и могут быть переопределены аргументами.
+  `sync_every` - вызывать `fsync` после каждых N записей, `sync_interval` - не реже чем раз в N секунд (0 - только при закрытии).
+  Недописанная запись в конце файла (например, после сбоя) при чтении пропускается"""
+
+  def __init__(self, path, ms2dat: MS2Dat1 = None, sync_every: int = 0, sync_interval: float = 0, **kw):
+    if ms2dat is None:
+      ms2dat = MS2Dat1()
+    self._f: typing.BinaryIO | None = None
+    self._last_sync = 0.0
+    self._unsynced = 0
+    self.dump_kw = {"compress_type": 0, "encrypted": 0, "hash_type": 1, "sort_keys": False, "use_dict": True, "compress_level": None, "compress_threads": 0}
+    for k, v in ms2dat._dump_kw.items():
+      if k in self.dump_kw:
+        self.dump_kw[k] = v
+    self.dump_kw.update(kw)
+    self.ms2dat = ms2dat
+    self.path = os.path.abspath(path)
+    self.sync_every = sync_every
+    self.sync_interval = sync_interval
+
+  def __repr__(self):
+    return ms.ObjectBase.__repr__(self, repr(self.path))
+
+  def _open(self):
+    if self._f is None:
+      f = builtins.open(self.path, "ab")
+      try:
+        if f.tell() == 0:
+          f.write(FILE_HEAD)
+        else:
+          with builtins.open(self.path, "rb") as check:
+            _read_head(check)
+            end = _valid_end(check)
+          if end < f.tell():
+            f.truncate(end)  # Недописанная запись после сбоя, иначе новые записи окажутся за ней
+      except BaseException:
+        f.close()
+        raise
+      self._f = f
+      self._last_sync = time.monotonic()
+    return self._f
+
+  def encode_record(self, obj) -> bytes:
+    """Собрать запись (заголовок, данные, хеш) без записи в файл"""
+    kw = self.dump_kw
+    writer = Writer(self.ms2dat, None, None)
+    raw_body = writer.build_body(obj, kw["sort_keys"], kw["use_dict"])
+    if len(writer.used_ctypes) > 0xff:
+      raise Exception("Too many custom types")
+    raw = bytearray()
+    raw.append(len(writer.used_ctypes))
+    for i in writer.used_ctypes:
+      name = i.typename.encode("utf-8")
+      raw.append(len(name))
+      raw.extend(name)
+    raw.extend(raw_body)
+    compress_type, body = compress_data(kw["compress_type"], raw, kw["compress_level"], kw["compress_threads"])
+    encrypted = 1 if kw["encrypted"] else 0
+    if encrypted:
+      body = self.ms2dat.encrypt_body(body)
+    hash_type = kw["hash_type"]
+    return RECORD_HEAD.pack(compress_type, (hash_type << 4) | (encrypted << 3), len(body)) + body + hash_data(hash_type, raw)
+
+  def append(self, obj) -> int:
+    """Дописать объект. Возвращает позицию после записи"""
+    record = self.encode_record(obj)
+    f = self._open()
+    f.write(record)
+    self._unsynced += 1
+    if self.sync_every and self._unsynced >= self.sync_every:
+      self.sync()
+    elif self.sync_interval and time.monotonic() - self._last_sync >= self.sync_interval:
+      self.sync()
+    return f.tell()
+
+  def extend(self, objs: typing.Iterable) -> int:
+    """Дописать несколько объектов. Возвращает позицию после последней записи"""
+    pos = 0
+    for obj in objs:
+      pos = self.append(obj)
+    return pos
+
+  def flush(self):
+    """Передать записанные данные в ОС"""
+    if self._f is not None:
+      self._f.flush()
+
+  def sync(self):
+    """Записать данные на диск (`fsync`)"""
+    if self._f is not None:
+      self._f.flush()
+      os.fsync(self._f.fileno())
+    self._last_sync = time.monotonic()
+    self._unsynced = 0
+
+  def close(self):
+    """Записать данные на диск и закрыть файл"""
+    if self._f is not None:
+      try:
+        if self._unsynced:
+          self.sync()
+      finally:
+        self._f.close()
+        self._f = None
+
+  def iter_records(self, offset: int = None, with_offset=False, allow_unknown=None, verify=None, memoryview_bytes=None, intern_strings=None) -> typing.Iterator:
+    """Лениво читать записи, начиная с позиции `offset` (по умолчанию с начала). При `with_offset=True` выдаются пары (позиция после записи, объект), с этой позиции можно продолжить чтение позже"""
+    load_kw = {"allow_unknown": False, "verify": True, "memoryview_bytes": False, "intern_strings": False}
+    load_kw.update(self.ms2dat._load_kw)
+    for k, v in ("allow_unknown", allow_unknown), ("verify", verify), ("memoryview_bytes", memoryview_bytes), ("intern_strings", intern_strings):
+      if v is not None:
+        load_kw[k] = v
+    intern_cache = {} if load_kw["intern_strings"] else None  # Общий для всех записей
+    self.flush()
+    with builtins.open(self.path, "rb") as f:
+      _read_head(f)
+      if offset is not None:
+        f.seek(offset)
+      pos = f.tell()
+      while True:
+        head = f.read(RECORD_HEAD.size)
+        if len(head) < RECORD_HEAD.size:
+          return
+        compress_type, flags, size = RECORD_HEAD.unpack(head)
+        hash_type = flags >> 4 & 0b11
+        if size + HASH_SIZES[hash_type] > os.fstat(f.fileno()).st_size - f.tell():
+          return  # Запись ещё не дописана или заголовок испорчен
+        body = f.read(size)
+        saved_hash = f.read(HASH_SIZES[hash_type])
+        if len(body) < size or len(saved_hash) < HASH_SIZES[hash_type]:
+          return  # Запись ещё не дописана
+        pos += RECORD_HEAD.size + size + len(saved_hash)
+        if flags >> 3 & 1:
+          body = self.ms2dat.decrypt_body(body)
+        raw = decompress_data(compress_type, body)
+        if load_kw["verify"] and hash_type:
+          if hash_data(hash_type, raw) != saved_hash:
+            raise ValueError(f"The record before position {pos} is corrupted")
+        obj = _decode_record(self.ms2dat, raw, load_kw["allow_unknown"], load_kw["memoryview_bytes"], intern_cache)
+        yield (pos, obj) if with_offset else obj
+
+  def __iter__(self):
+    return self.iter_records()
+
+
+def _read_head(f: typing.BinaryIO):
+  if f.read(len(FILE_HEAD)) != FILE_HEAD:
+    raise ValueError("Invalid record log header")
+
+
+def _valid_end(f: typing.BinaryIO) -> int:
+  """Позиция после последней целой записи (по размерам из заголовков, без чтения данных)"""
+  file_size = os.fstat(f.fileno()).st_size
+  pos = f.tell()
+  while True:
+    head = f.read(RECORD_HEAD.size)
+    if len(head) < RECORD_HEAD.size:
+      return pos
+    compress_type, flags, size = RECORD_HEAD.unpack(head)
+    end = pos + RECORD_HEAD.size + size + HASH_SIZES[flags >> 4 & 0b11]
+    if end > file_size:
+      return pos
+    f.seek(end)
+    pos = end
+
+
+def _decode_record(ms2dat: MS2Dat1, raw: bytes, allow_unknown: bool, memoryview_bytes: bool, intern_cache: dict | None):
+  custom_types: list[str] = []
+  pos = 1
+  for i in range(raw[0]):
+    size = raw[pos]
+    custom_types.append(bytes(raw[pos + 1:pos + 1 + size]).decode("utf-8"))
+    pos += 1 + size
+  reader = FrameReader(ms2dat, custom_types, allow_unknown, memoryview_bytes)
+  reader.intern_cache = intern_cache
+  return reader.decode_body(memoryview(raw)[pos:])
@@ -1,9 +1,14 @@
 import argparse
+import contextlib
 import hashlib
 import os
 import shlex
 import sys
+import time
+import typing
 from MainShortcuts2 import ms
+HASH_CHUNK_SIZE = 2**20
+MERKLE_CHUNK_SIZE = 2**22
 HASH_SUFFIX = ".MS2_hash"
 HASH_TYPES = ["blake2b", "blake2s", "md5", "sha1", "sha224", "sha256", "sha384", "sha3_224", "sha3_256", "sha3_384", "sha3_512", "sha512"]
 
@@ -47,6 +52,252 @@ def get_pbar(filename: str, enabled: bool, **kw):
   return progressbar.ProgressBar(**kw)
 
 
+class _TotalPbar:
+  """Общий прогрессбар для файлов, обрабатываемых параллельно. `update(file, done)` безопасно вызывать из разных потоков"""
+
+  def __init__(self, files: list[str]):
+    import threading
+    self.lock = threading.Lock()
+    self.sizes: dict[str, int] = {}
+    for file in files:
+      self.sizes[file] = os.path.getsize(file) if os.path.isfile(file) else 0
+    self.done = dict.fromkeys(self.sizes, 0)
+    self.value = 0
+    self.pbar = get_pbar("Файлов: %i" % len(files), True, max_value=sum(self.sizes.values()))
+
+  def __enter__(self):
+    self.pbar.start()
+    return self
+
+  def __exit__(self, *a):
+    self.pbar.finish()
+
+  def update(self, file: str, done: int):
+    with self.lock:
+      self.value += done - self.done[file]
+      self.done[file] = done
+      self.pbar.update(self.value)
+
+  def callback(self, file: str) -> typing.Callable[[int], None]:
+    return lambda done: self.update(file, done)
+
+  def finish_file(self, file: str):
+    self.update(file, self.sizes[file])
+
+
+def hash_file(path: str, hash_type: str = "sha512", progress: typing.Callable[[int], typing.Any] = None, *, chunk_size: int = HASH_CHUNK_SIZE, progress_interval: float = 0.1) -> "hashlib._Hash":
+  """Посчитать хеш файла, читая его блоками по `chunk_size` байт в один и тот же буфер.
+  `progress(кол-во прочитанных байт)` вызывается не чаще раза в `progress_interval` секунд и после чтения всего файла"""
+  with open(path, "rb") as f:
+    if progress is None and hasattr(hashlib, "file_digest"):  # Python 3.11+
+      return hashlib.file_digest(f, hash_type)
+    hash = hashlib.new(hash_type)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    done = 0
+    next_progress = time.monotonic() + progress_interval
+    while True:
+      size = f.readinto(buf)
+      if not size:
+        break
+      hash.update(view[:size])
+      done += size
+      if progress is not None and time.monotonic() >= next_progress:
+        progress(done)
+        next_progress = time.monotonic() + progress_interval
+    if progress is not None:
+      progress(done)
+    return hash
+
+
+def hash_chunks(path: str, hash_type: str = "sha512", chunk_size: int = MERKLE_CHUNK_SIZE, workers: int = None) -> list[bytes]:
+  """Хеши частей файла по `chunk_size` байт. Части хешируются в `workers` потоках (по умолчанию кол-во ядер)"""
+  if chunk_size <= 0:
+    raise ValueError("Chunk size must be positive")
+  if workers is None:
+    workers = os.cpu_count() or 1
+  count = -(-os.path.getsize(path) // chunk_size)
+  if workers <= 1 or count <= 1:
+    result = []
+    with open(path, "rb") as f:
+      while True:
+        buf = f.read(chunk_size)
+        if not buf:
+          break
+        result.append(hashlib.new(hash_type, buf).digest())
+    return result
+  from concurrent.futures import ThreadPoolExecutor
+
+  def task(index: int) -> bytes:
+    with open(path, "rb") as f:
+      f.seek(index * chunk_size)
+      return hashlib.new(hash_type, f.read(chunk_size)).digest()
+  with ThreadPoolExecutor(workers) as pool:
+    return list(pool.map(task, range(count)))
+
+
+def merkle_root(hash_type: str, leaves: list[bytes]) -> bytes:
+  """Корень дерева Меркла. Узел - хеш от `0x01` + левый + правый, узел без пары переходит на уровень выше. Для пустого списка - хеш пустой строки"""
+  if not leaves:
+    return hashlib.new(hash_type).digest()
+  level = leaves
+  while len(level) > 1:
+    next_level = [hashlib.new(hash_type, b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+      next_level.append(level[-1])
+    level = next_level
+  return level[0]
+
+
+def _sqlite_int(n: int) -> int:
+  # В SQLite INTEGER со знаком, а inode и номер устройства бывают больше 2**63
+  return n - 2**64 if n >= 2**63 else n
+
+
+class HashCache(ms.ObjectBase):
+  """Кэш хешей файлов в SQLite (`ms.sql.sqlite.Database`). Запись действительна, пока у файла не изменились устройство, inode, размер и `mtime_ns`.
+  `hits` и `misses` - кол-во файлов, хеши которых были найдены и не найдены в кэше"""
+  TABLE = "file_hashes"
+  SCHEMA = {TABLE: {"dev": "INTEGER", "ino": "INTEGER", "size": "INTEGER", "mtime_ns": "INTEGER", "alg": "TEXT", "digest": "BLOB"}}
+
+  def __init__(self, path: str, save_every: int = 1000, **kw):
+    import threading
+    from MainShortcuts2.sql.sqlite import Database
+    kw["autosave"] = False
+    kw["schema"] = self.SCHEMA
+    self._lock = threading.Lock()
+    self._unsaved = 0
+    self.db = Database(path, **kw)
+    self.db.exec(f"CREATE UNIQUE INDEX IF NOT EXISTS {self.TABLE}_key ON {self.TABLE} (dev, ino, alg)", fetch=False)
+    self.hits = 0
+    self.misses = 0
+    self.save_every = save_every
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *a):
+    self.close()
+
+  @staticmethod
+  def _key(st: os.stat_result) -> tuple[int, int, int, int]:
+    return _sqlite_int(st.st_dev), _sqlite_int(st.st_ino), st.st_size, st.st_mtime_ns
+
+  @property
+  def stats(self) -> dict[str, int]:
+    return {"hits": self.hits, "misses": self.misses}
+
+  def get(self, st: os.stat_result, algs: typing.Iterable[str]) -> dict[str, bytes]:
+    """Найти хеши файла по результату `os.stat`. Возвращает только найденные алгоритмы"""
+    dev, ino, size, mtime_ns = self._key(st)
+    with self._lock:
+      rows = self.db.exec(f"SELECT alg, digest FROM {self.TABLE} WHERE dev=? AND ino=? AND size=? AND mtime_ns=?", (dev, ino, size, mtime_ns))
+    found = dict(rows)
+    return {i: found[i] for i in algs if i in found}
+
+  def put(self, st: os.stat_result, digests: dict[str, bytes]):
+    """Сохранить хеши файла"""
+    dev, ino, size, mtime_ns = self._key(st)
+    with self._lock:
+      for alg, digest in digests.items():
+        self.db.exec(f"INSERT OR REPLACE INTO {self.TABLE} (dev, ino, size, mtime_ns, alg, digest) VALUES (?, ?, ?, ?, ?, ?)", (dev, ino, size, mtime_ns, alg, digest), fetch=False)
+      self._unsaved += 1
+      if self._unsaved >= self.save_every:
+        self.db.save()
+        self._unsaved = 0
+
+  def hash_multi(self, path: str, algs: typing.Iterable[str], hasher: typing.Callable[[str, set[str]], dict[str, bytes]]) -> dict[str, bytes]:
+    """Хеши файла из кэша. Недостающие считаются через `hasher(path, algs)` и сохраняются, если файл не изменился во время чтения"""
+    algs = set(algs)
+    try:
+      st = os.stat(path)
+    except OSError:  # Ошибку сообщит hasher
+      return hasher(path, algs)
+    result = self.get(st, algs)
+    missing = algs - result.keys()
+    if not missing:
+      with self._lock:
+        self.hits += 1
+      return result
+    with self._lock:
+      self.misses += 1
+    digests = hasher(path, missing)
+    if self._key(os.stat(path)) == self._key(st):
+      self.put(st, digests)
+    result.update(digests)
+    return result
+
+  def hash_many(self, paths: typing.Iterable[str], algs: typing.Iterable[str], hasher: typing.Callable[[list[str], set[str]], dict[str, dict[str, bytes]]]) -> dict[str, dict[str, bytes]]:
+    """Как `hash_multi`, но для нескольких файлов: файлы, которых нет в кэше, передаются в `hasher(paths, algs)` одним списком.
+    Ключи результата `hasher` сопоставляются с переданными путями, даже если он их нормализовал. Файлы, для которых не удался `os.stat`, передаются в `hasher` без кэша"""
+    algs = set(algs)
+    result = {}
+    stats: dict[str, os.stat_result | None] = {}
+    for path in paths:
+      try:
+        st = os.stat(path)
+      except OSError:  # Ошибку сообщит hasher
+        stats[path] = None
+        continue
+      found = self.get(st, algs)
+      if len(found) == len(algs):
+        result[path] = found
+      else:
+        stats[path] = st
+    with self._lock:
+      self.hits += len(result)
+      self.misses += len(stats)
+    if stats:
+      by_real = {_real_path(i): i for i in stats}
+      for key, digests in hasher(list(stats), algs).items():
+        path = key if key in stats else by_real.get(_real_path(key), key)
+        st = stats.get(path)
+        if st is not None:
+          try:
+            unchanged = self._key(os.stat(path)) == self._key(st)
+          except OSError:
+            unchanged = False
+          if unchanged:
+            self.put(st, digests)
+        result[path] = digests
+    return result
+
+  def save(self):
+    with self._lock:
+      self.db.save()
+      self._unsaved = 0
+
+  def close(self):
+    with self._lock:
+      self.db.close()
+
+
+cache: HashCache | None = None  # Кэш по умолчанию для всех функций хеширования MS2
+
+
+def _real_path(path: str) -> str:
+  return os.path.normcase(os.path.realpath(path))
+
+
+def set_cache(path: str | HashCache | None, **kw) -> HashCache | None:
+  """Включить кэш хешей по умолчанию (путь к БД или `HashCache`) или выключить его (`None`)"""
+  global cache
+  if path is None or isinstance(path, HashCache):
+    cache = path
+  else:
+    cache = HashCache(path, **kw)
+  return cache
+
+
+def get_cache(value: HashCache | None | bool = None) -> HashCache | None:
+  """Кэш для функции хеширования: переданный, кэш по умолчанию (`None`) или без кэша (`False`)"""
+  if value is None:
+    return cache
+  if value is False:
+    return None
+  return value
+
+
 class Format1:
   def __init__(self, *, file_size: int, hash_hex: str, hash_type: str):
     assert hash_type in HASH_TYPES
@@ -62,18 +313,26 @@ class Format1:
     return cls(**kw)
 
   @classmethod
-  def generate(cls, path: str, enable_pbar: bool, **kw):
+  def generate(cls, path: str, enable_pbar: bool, *, cache: HashCache | bool = None, progress: typing.Callable[[int], typing.Any] = None, **kw):
     file = ms.path.Path(path)
     kw.setdefault("hash_type", "sha512")
-    hash: hashlib._Hash = getattr(hashlib, kw["hash_type"])()
     kw["file_size"] = file.size
-    with open(path, "rb") as f:
-      with get_pbar(file.full_name, enable_pbar, max_value=file.size) as pbar:
-        pbar.start()
-        for i in f:
-          hash.update(i)
-          pbar.update(pbar.value + len(i))
-    kw["hash_hex"] = hash.hexdigest()
+    hash_type = kw["hash_type"]
+
+    def compute(path: str, algs=None) -> dict[str, bytes]:
+      if progress is not None:
+        return {hash_type: hash_file(path, hash_type, progress).digest()}
+      if enable_pbar:
+        with get_pbar(file.full_name, enable_pbar, max_value=file.size) as pbar:
+          pbar.start()
+          return {hash_type: hash_file(path, hash_type, pbar.update).digest()}
+      return {hash_type: hash_file(path, hash_type).digest()}
+    cache = get_cache(cache)
+    if cache is None:
+      digest = compute(path)[hash_type]
+    else:
+      digest = cache.hash_multi(path, [hash_type], compute)[hash_type]
+    kw["hash_hex"] = digest.hex()
     return cls(**kw)
 
   def to_dict(self):
@@ -84,32 +343,234 @@ class Format1:
     return data
 
 
+class Format2:
+  """Хеш по частям: хеши частей файла фиксированного размера и корень дерева Меркла.
+  Части хешируются параллельно, а при проверке видно, какие диапазоны байт повреждены"""
+  FORMAT = "MainShortcuts2_hash_v2"
+
+  def __init__(self, *, chunk_hashes: list[bytes], chunk_size: int, file_size: int, hash_type: str):
+    assert hash_type in HASH_TYPES
+    self.chunk_hashes = chunk_hashes
+    self.chunk_size = chunk_size
+    self.file_size = file_size
+    self.hash_type = hash_type
+
+  @property
+  def root(self) -> bytes:
+    return merkle_root(self.hash_type, self.chunk_hashes)
+
+  @property
+  def hash_hex(self) -> str:
+    """Корень дерева в HEX"""
+    return self.root.hex()
+
+  @classmethod
+  def from_dict(cls, data: dict, **kw):
+    if data.get("format") != cls.FORMAT:
+      raise ValueError("Unsupported hash format: %r" % data.get("format"))
+    kw.setdefault("chunk_hashes", [bytes.fromhex(i) for i in data["hash"]["chunks"]])
+    kw.setdefault("chunk_size", data["hash"]["chunk_size"])
+    kw.setdefault("file_size", data["file"]["size"])
+    kw.setdefault("hash_type", data["hash"]["type"])
+    self = cls(**kw)
+    if self.hash_hex != data["hash"]["root"]:
+      raise ValueError("Merkle root does not match chunk hashes")
+    return self
+
+  @classmethod
+  def generate(cls, path: str, *, chunk_size: int = MERKLE_CHUNK_SIZE, workers: int = None, **kw):
+    kw.setdefault("hash_type", "sha512")
+    kw["chunk_size"] = chunk_size
+    kw["file_size"] = os.path.getsize(path)
+    kw["chunk_hashes"] = hash_chunks(path, kw["hash_type"], chunk_size, workers)
+    return cls(**kw)
+
+  def to_dict(self):
+    data = {}
+    data["file"] = {"size": self.file_size}
+    data["format"] = self.FORMAT
+    data["hash"] = {"chunk_size": self.chunk_size, "chunks": [i.hex() for i in self.chunk_hashes], "root": self.hash_hex, "type": self.hash_type}
+    return data
+
+  def verify(self, path: str, workers: int = None) -> list[tuple[int, int]]:
+    """Проверить файл. Возвращает повреждённые диапазоны байт `(начало, конец)` (конец не включается), пустой список - файл не изменён"""
+    chunks = hash_chunks(path, self.hash_type, self.chunk_size, workers)
+    size = max(self.file_size, os.path.getsize(path))
+    ranges: list[tuple[int, int]] = []
+    for i in range(max(len(chunks), len(self.chunk_hashes))):
+      if i < len(chunks) and i < len(self.chunk_hashes) and chunks[i] == self.chunk_hashes[i]:
+        continue
+      start = i * self.chunk_size
+      end = min(start + self.chunk_size, size)
+      if ranges and ranges[-1][1] == start:
+        ranges[-1] = (ranges[-1][0], end)
+      else:
+        ranges.append((start, end))
+    return ranges
+
+
+def load_hash(data: dict) -> Format1 | Format2:
+  """Загрузить хеш любого формата из словаря"""
+  if data.get("format") == Format2.FORMAT:
+    return Format2.from_dict(data)
+  return Format1.from_dict(data)
+
+
+def _device(path: str) -> int | None:
+  try:
+    return os.stat(path).st_dev
+  except OSError:
+    return None
+
+
+def _is_rotational(dev: int) -> bool:
+  """Находится ли устройство на жёстком диске (HDD). Определяется только в Linux, в остальных случаях `False`"""
+  if not hasattr(os, "major"):
+    return False
+  base = "/sys/dev/block/%i:%i" % (os.major(dev), os.minor(dev))
+  for path in (base + "/queue/rotational", base + "/../queue/rotational"):  # Диск или раздел
+    try:
+      with open(path, "r") as f:
+        return f.read().strip() == "1"
+    except OSError:
+      pass
+  return False
+
+
+def unique_files(files: list[str]) -> list[str]:
+  """Пути к файлам без суффикса хеша и без повторов (порядок сохраняется)"""
+  result = []
+  seen = set()
+  for file in files:
+    while file.lower().endswith(HASH_SUFFIX.lower()):
+      file = file[:0 - len(HASH_SUFFIX)]
+    if file not in seen:
+      seen.add(file)
+      result.append(file)
+  return result
+
+
+def run_ordered(func, files: list[str], jobs: int = None, per_device: int = None):
+  """Выполнить `func(file)` для каждого файла в `jobs` потоках, результаты выдаются в порядке файлов.
+  Файлы группируются по устройствам: с одного устройства одновременно читается не больше `per_device` файлов
+  (по умолчанию 1 для HDD, чтобы головка не металась между файлами, и без ограничения для остальных)"""
+  if jobs is None:
+    jobs = os.cpu_count() or 1
+  if jobs <= 1 or len(files) <= 1:
+    for file in files:
+      yield func(file)
+    return
+  import itertools
+  import threading
+  from concurrent.futures import ThreadPoolExecutor
+  groups: dict[int | None, list[str]] = {}
+  for file in files:
+    groups.setdefault(_device(file), []).append(file)
+  locks: dict[str, threading.Semaphore] = {}
+  for dev, group in groups.items():
+    limit = per_device
+    if limit is None:
+      limit = 1 if dev is not None and _is_rotational(dev) else 0
+    if limit > 0:
+      lock = threading.Semaphore(limit)
+      for file in group:
+        locks[file] = lock
+
+  def task(file: str):
+    lock = locks.get(file)
+    if lock is None:
+      return func(file)
+    with lock:
+      return func(file)
+  with ThreadPoolExecutor(jobs) as pool:
+    futures = {}
+    # Чередовать устройства, чтобы потоки не ждали одно устройство
+    for file in itertools.chain.from_iterable(itertools.zip_longest(*groups.values())):
+      if file is not None:
+        futures[file] = pool.submit(task, file)
+    try:
+      for file in files:
+        yield futures.pop(file).result()
+    finally:
+      for i in futures.values():
+        i.cancel()
+
+
+def _positive_int(value: str) -> int:
+  result = int(value)
+  if result <= 0:
+    raise argparse.ArgumentTypeError("must be positive: %r" % value)
+  return result
+
+
+def _print_messages(messages: list[tuple[str, bool]]):
+  for text, is_error in messages:
+    print(text, file=sys.stderr if is_error else sys.stdout)
+
+
+def _add_jobs_args(argp: argparse.ArgumentParser):
+  argp.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="кол-во файлов, обрабатываемых одновременно (по умолчанию кол-во ядер)")
+  argp.add_argument("--per-device", type=int, help="макс. кол-во одновременно читаемых файлов с одного диска (по умолчанию 1 для HDD и без ограничения для остальных, 0 - без ограничения)")
+  argp.add_argument("--cache", metavar="PATH", help="кэш хешей в SQLite: неизменённые файлы (те же inode, размер и время изменения) не перечитываются")
+
+
+def _open_cache(args: argparse.Namespace) -> HashCache | None:
+  if getattr(args, "cache", None):
+    return HashCache(args.cache)
+  return None
+
+
+def _close_cache(cache: HashCache | None):
+  if cache is not None:
+    cache.close()
+    print("Кэш хешей: найдено %i, посчитано %i" % (cache.hits, cache.misses), file=sys.stderr)
+
+
 def hash_gen(args: argparse.Namespace = None):
   if args is None:
     argp = argparse.ArgumentParser("ms2-hash_gen", description="Создание контрольной суммы для файла")
     argp.epilog = "Написано на Python"
     argp.add_argument("files", nargs="+", help="пути к файлам")
-    argp.add_argument("-b", "--bar", action="store_true", help="показывать прогрессбар (нужен модуль progressbar2)")
+    argp.add_argument("-b", "--bar", action="store_true", help="показывать прогрессбар (нужен модуль progressbar2, при обработке нескольких файлов одновременно - общий)")
     argp.add_argument("-f", "--force", action="store_true", help="перезаписывать существующие хеши")
     argp.add_argument("-t", "--type", choices=HASH_TYPES, default="sha512", help="тип контрольной суммы")
+    argp.add_argument("--format", type=int, choices=[1, 2], default=1, help="формат хеша: 1 - хеш всего файла, 2 - хеши частей и дерево Меркла (параллельное хеширование, при проверке видны повреждённые байты)")
+    argp.add_argument("--chunk-size", type=_positive_int, default=MERKLE_CHUNK_SIZE // 2**20, help="размер части для формата 2 (МБ)")
+    _add_jobs_args(argp)
     args = argp.parse_args()
-  completed = []
-  for file in args.files:
-    while file.lower().endswith(HASH_SUFFIX.lower()):
-      file = file[:0 - len(HASH_SUFFIX)]
-    if file in completed:
-      continue
+  jobs = getattr(args, "jobs", 1)
+  cache = _open_cache(args)
+  files = unique_files(args.files)
+  chunk_jobs = max(1, jobs // len(files))
+  total_pbar = _TotalPbar(files) if args.bar and jobs > 1 and len(files) > 1 else None
+  enable_pbar = args.bar and total_pbar is None
+
+  def process(file: str) -> list[tuple[str, bool]]:
+    if total_pbar is None:
+      return process_one(file)
+    try:
+      return process_one(file)
+    finally:
+      total_pbar.finish_file(file)
+
+  def process_one(file: str) -> list[tuple[str, bool]]:
     if os.path.isdir(file):
-      print("Пропуск файла " + shlex.quote(file) + ": это папка", file=sys.stderr)
-      completed.append(file)
-      continue
+      return [("Пропуск файла " + shlex.quote(file) + ": это папка", True)]
     if os.path.isfile(file + HASH_SUFFIX):
       if not args.force:
-        print("Пропуск файла " + shlex.quote(file) + ": хеш существует", file=sys.stderr)
-        continue
-    hash = Format1.generate(file, args.bar, hash_type=args.type)
+        return [("Пропуск файла " + shlex.quote(file) + ": хеш существует", True)]
+    if getattr(args, "format", 1) == 2:
+      hash = Format2.generate(file, chunk_size=args.chunk_size * 2**20, workers=chunk_jobs, hash_type=args.type)
+    else:
+      hash = Format1.generate(file, enable_pbar, hash_type=args.type, cache=cache, progress=None if total_pbar is None else total_pbar.callback(file))
     ms.json.write(file + HASH_SUFFIX, hash.to_dict())
-    completed.append(file)
+    return []
+  try:
+    with total_pbar or contextlib.nullcontext():
+      for messages in run_ordered(process, files, jobs, getattr(args, "per_device", None)):
+        _print_messages(messages)
+  finally:
+    _close_cache(cache)
 
 
 def hash_check(args: argparse.Namespace = None):
@@ -117,31 +578,82 @@ def hash_check(args: argparse.Namespace = None):
     argp = argparse.ArgumentParser("ms2-hash_check", description="Проверка размера и контрольной суммы файла")
     argp.epilog = "Написано на Python"
     argp.add_argument("files", nargs="+", help="пути к файлам")
-    argp.add_argument("-b", "--bar", action="store_true", help="показывать прогрессбар (нужен модуль progressbar2)")
+    argp.add_argument("-b", "--bar", action="store_true", help="показывать прогрессбар (нужен модуль progressbar2, при обработке нескольких файлов одновременно - общий)")
+    _add_jobs_args(argp)
     args = argp.parse_args()
-  completed = []
-  for file in args.files:
-    while file.lower().endswith(HASH_SUFFIX.lower()):
-      file = file[:0 - len(HASH_SUFFIX)]
-    if file in completed:
-      continue
+  jobs = getattr(args, "jobs", 1)
+  cache = _open_cache(args)
+  files = unique_files(args.files)
+  chunk_jobs = max(1, jobs // len(files))
+  total_pbar = _TotalPbar(files) if args.bar and jobs > 1 and len(files) > 1 else None
+  enable_pbar = args.bar and total_pbar is None
+
+  def process(file: str) -> list[tuple[str, bool]]:
+    if total_pbar is None:
+      return process_one(file)
+    try:
+      return process_one(file)
+    finally:
+      total_pbar.finish_file(file)
+
+  def process_one(file: str) -> list[tuple[str, bool]]:
     if os.path.isdir(file):
-      print("Пропуск файла " + shlex.quote(file) + ": это папка", file=sys.stderr)
-      completed.append(file)
-      continue
+      return [("Пропуск файла " + shlex.quote(file) + ": это папка", True)]
     if not os.path.exists(file + HASH_SUFFIX):
-      print("Ошибка: не найден файл " + shlex.quote(file + HASH_SUFFIX), file=sys.stderr)
-      continue
-    saved_hash = Format1.from_dict(ms.json.read(file + HASH_SUFFIX))
+      return [("Ошибка: не найден файл " + shlex.quote(file + HASH_SUFFIX), True)]
+    saved_hash = load_hash(ms.json.read(file + HASH_SUFFIX))
+    if isinstance(saved_hash, Format2):
+      ranges = saved_hash.verify(file, chunk_jobs)
+      if not ranges:
+        return [("Успех: файл " + shlex.quote(file) + " не изменён", False)]
+      text = ", ".join("%i-%i" % (start, end - 1) for start, end in ranges)
+      return [("Ошибка: файл " + shlex.quote(file) + " изменён, повреждены байты " + text, False)]
     if saved_hash.file_size != os.path.getsize(file):
-      print("Ошибка: размер файла " + shlex.quote(file) + " не совпадает", file=sys.stderr)
-      continue
-    real_hash = Format1.generate(file, args.bar, hash_type=saved_hash.hash_type)
+      return [("Ошибка: размер файла " + shlex.quote(file) + " не совпадает", True)]
+    real_hash = Format1.generate(file, enable_pbar, hash_type=saved_hash.hash_type, cache=cache, progress=None if total_pbar is None else total_pbar.callback(file))
     if saved_hash.hash_hex == real_hash.hash_hex:
-      print("Успех: файл " + shlex.quote(file) + " не изменён")
-    else:
-      print("Ошибка: файл " + shlex.quote(file) + " изменён")
-    completed.append(file)
+      return [("Успех: файл " + shlex.quote(file) + " не изменён", False)]
+    return [("Ошибка: файл " + shlex.quote(file) + " изменён", False)]
+  try:
+    with total_pbar or contextlib.nullcontext():
+      for messages in run_ordered(process, files, jobs, getattr(args, "per_device", None)):
+        _print_messages(messages)
+  finally:
+    _close_cache(cache)
+
+
+def sums_check(args: argparse.Namespace = None):
+  if args is None:
+    argp = argparse.ArgumentParser("ms2-sums_check", description="Проверка файлов по списку контрольных сумм (как `sha256sum -c`)")
+    argp.epilog = "Написано на Python"
+    argp.add_argument("manifests", nargs="+", help="пути к спискам (sha256sums.txt и т.п.)")
+    argp.add_argument("-a", "--alg", choices=HASH_TYPES, help="тип контрольной суммы (по умолчанию определяется по длине)")
+    argp.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="кол-во файлов, обрабатываемых одновременно (по умолчанию кол-во ядер)")
+    argp.add_argument("-q", "--quiet", action="store_true", help="не выводить успешно проверенные файлы")
+    argp.add_argument("-r", "--root", help="папка, относительно которой указаны файлы (по умолчанию папка списка)")
+    argp.add_argument("--cache", metavar="PATH", help="кэш хешей в SQLite: неизменённые файлы (те же inode, размер и время изменения) не перечитываются")
+    args = argp.parse_args()
+  cache = _open_cache(args)
+  counts = {"ok": 0, "mismatch": 0, "missing": 0, "error": 0}
+  try:
+    for manifest in args.manifests:
+      for result in ms.utils.verify_shaXsums(manifest, args.root, alg=args.alg, cache=cache or False, jobs=args.jobs):
+        counts[result.status] += 1
+        if result.status == "ok":
+          if not args.quiet:
+            print(result.filename + ": OK")
+        elif result.status == "mismatch":
+          print(result.filename + ": FAILED")
+        elif result.status == "missing":
+          print(result.filename + ": FAILED open or read", file=sys.stderr)
+        else:
+          print(result.filename + ": FAILED " + result.actual, file=sys.stderr)
+  finally:
+    _close_cache(cache)
+  if counts["mismatch"] or counts["missing"] or counts["error"]:
+    print("Ошибка: не совпало %i, не найдено %i, ошибок чтения %i из %i" % (counts["mismatch"], counts["missing"], counts["error"], sum(counts.values())), file=sys.stderr)
+    return 1
+  return 0
 
 
 def run_java_ext(argv: list[str] = None):
@@ -337,9 +337,9 @@ class Path(os.PathLike):
     """Открыть файл на чтение/запись"""
     return open(self.path, mode, **kw)
 
-  def hash(self, algorithm: str, chunk_size=ms.file.CHUNK_SIZE):
-    """Хеш файла (`bytes`)"""
-    return self.pathlib_path.hash(algorithm, bufsize=chunk_size)
+  def hash(self, algorithm: str, chunk_size=ms.file.CHUNK_SIZE, cache=None):
+    """Хеш файла (`bytes`). `cache` - `ms.ms2hash.HashCache`, `None` - кэш по умолчанию, `False` - без кэша"""
+    return self.pathlib_path.hash(algorithm, bufsize=chunk_size, cache=cache)
 
   def hash_hex(self, algorithm: str, **kw):
     """Хеш файла (`bytes.hex()`)"""
@@ -350,9 +350,9 @@ class Path(os.PathLike):
     from base64 import b85encode
     return b85encode(self.hash(algorithm, **kw)).decode()
 
-  def multi_hash(self, algorithms: list[str], chunk_size=ms.file.CHUNK_SIZE):
-    """Хеш файла (`bytes`) для нескольких алгоритмов"""
-    return self.pathlib_path.hash_multi(algorithms, bufsize=chunk_size)
+  def multi_hash(self, algorithms: list[str], chunk_size=ms.file.CHUNK_SIZE, cache=None):
+    """Хеш файла (`bytes`) для нескольких алгоритмов. `cache` - как в `hash`"""
+    return self.pathlib_path.hash_multi(algorithms, bufsize=chunk_size, cache=cache)
 
   def multi_hash_hex(self, algorithms: list[str], **kw):
     """Хеш файла в HEX строке для нескольких алгоритмов"""
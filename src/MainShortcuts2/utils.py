@@ -10,7 +10,7 @@ import time
 import typing
 import uuid as UuidModule
 from .core import ms
-from contextlib import ExitStack
+from contextlib import AsyncExitStack, ExitStack
 from functools import wraps
 from warnings import warn
 cache = {}
@@ -166,33 +166,47 @@ def args2kwargs(func: typing.Callable, args=(), kwargs: dict[str, typing.Any] =
   return tuple(args), kw
 
 
-async def async_download_file(url: str, path: str, *, cb_end=return_None, cb_progress=return_None, cb_start=return_None, chunk_size: int = 1024, delete_on_error: bool = True, **kw):
-  """Асинхронная функция для скачивания файла | `aiohttp`"""
+async def async_download_file(url: str, path: str, *, cb_end=return_None, cb_progress=return_None, cb_start=return_None, chunk_size: int = 65536, delete_on_error: bool = True, **kw):
+  """Асинхронная функция для скачивания файла | `aiohttp`.
+  Без `session` создаётся временная сессия, которая закрывается после скачивания. Запись в файл выполняется в отдельном потоке.
+  Функции `cb_*` могут быть как обычными, так и асинхронными"""
+  import asyncio
+  import inspect
+
+  async def call(func, *args):
+    result = func(*args)
+    if inspect.isawaitable(result):
+      await result
   kw.setdefault("method", "GET")
   kw["url"] = url
-  with ExitStack() as stack:
-    async with async_request(**kw) as resp:  # type: ignore
-      if callable(getattr(path, "write", None)):
-        f: typing.IO[bytes] = path
-      else:
-        f = stack.enter_context(open(path, "wb"))
-      size = 0
-      await cb_start(f, resp, size)
-      try:
-        async for chunk in resp.content.iter_chunked(chunk_size):
-          size += f.write(chunk)
-          await cb_progress(f, resp, size)
-      except:
-        if delete_on_error:
-          if os.path.isfile(path):
-            os.remove(path)
-        raise
-      cb_end(f, resp, size)
+  async with AsyncExitStack() as stack:
+    if kw.get("session") is None:
+      aiohttp = importlib.import_module("aiohttp")
+      kw["session"] = await stack.enter_async_context(aiohttp.ClientSession())
+    resp = await stack.enter_async_context(await async_request(**kw))
+    if callable(getattr(path, "write", None)):
+      f: typing.IO[bytes] = path
+    else:
+      f = stack.enter_context(open(path, "wb"))
+    size = 0
+    await call(cb_start, f, resp, size)
+    try:
+      async for chunk in resp.content.iter_chunked(chunk_size):
+        size += await asyncio.to_thread(f.write, chunk)
+        await call(cb_progress, f, resp, size)
+    except:
+      if delete_on_error and f is not path:
+        f.close()
+        if os.path.isfile(path):
+          os.remove(path)
+      raise
+    await call(cb_end, f, resp, size)
   return size
 
 
 async def async_request(method: str, url: str, *, ignore_status: bool = False, session=None, **kw):
-  """Асинхронный HTTP запрос | `aiohttp`"""
+  """Асинхронный HTTP запрос | `aiohttp`.
+  Без `session` создаётся временная сессия: тело ответа читается сразу, после чего сессия закрывается"""
   from importlib import import_module
   aiohttp = import_module("aiohttp")
   # import aiohttp
@@ -204,11 +218,18 @@ async def async_request(method: str, url: str, *, ignore_status: bool = False, s
       raise TypeError("Only one argument can be `Response`")
     resp = url
   if resp is None:
-    if session is None:
+    own_session = session is None
+    if own_session:
       session = aiohttp.ClientSession()
     kw["method"] = method
     kw["url"] = url
-    resp = await session.request(**kw)
+    try:
+      resp = await session.request(**kw)
+      if own_session:
+        await resp.read()
+    finally:
+      if own_session:
+        await session.close()
   if not ignore_status:
     resp.raise_for_status()
   return resp
@@ -309,13 +330,28 @@ def riot(**t_kw):
   return decorator
 
 
-def sync_download_file(url: str, path: str, *, cb_end=return_None, cb_progress=return_None, cb_start=return_None, chunk_size: int = 1024, delete_on_error: bool = True, **kw) -> int:
-  """Синхронная функция для скачивания файла | `requests`"""
+def sync_download_file(url: str, path: str, *, cache=None, cb_end=return_None, cb_progress=return_None, cb_start=return_None, chunk_size: int = 65536, delete_on_error: bool = True, **kw) -> int:
+  """Синхронная функция для скачивания файла | `requests`
+  `cache` - `ms.advanced.DownloadCache`: файл из кэша скачивается условным запросом и при ответе 304 копируется из кэша (колбэки получают `None` вместо файла)"""
+  if callable(getattr(path, "write", None)):
+    cache = None
+  entry = None if cache is None else cache.lookup(url)
+  if entry is not None:
+    retry_kw = dict(kw)
+    kw["headers"] = dict(kw.get("headers") or {})
+    kw["headers"].update(entry["headers"])
   kw.setdefault("method", "GET")
   kw["stream"] = True
   kw["url"] = url
   with ExitStack() as stack:
     resp = stack.enter_context(sync_request(**kw))
+    if entry is not None and resp.status_code == 304:
+      cb_start(None, resp, 0)
+      size = cache.restore(url, path)
+      if size is None:  # Файл удалён из кэша, пока шёл запрос
+        return sync_download_file(url, path, cache=cache, cb_end=cb_end, cb_progress=cb_progress, cb_start=cb_start, chunk_size=chunk_size, delete_on_error=delete_on_error, **retry_kw)
+      cb_end(None, resp, size)
+      return size
     if callable(getattr(path, "write", None)):
       f: typing.IO[bytes] = path
     else:
@@ -333,14 +369,15 @@ def sync_download_file(url: str, path: str, *, cb_end=return_None, cb_progress=r
           os.remove(path)
       raise
     cb_end(f, resp, size)
+  if cache is not None:
+    cache.store(url, path, resp.headers)
   return size
 
 
 download_file = sync_download_file
 
 
-def sync_request(method: str, url: str, *, ignore_status: bool = False, session=None, **kw):
-  """Синхронный HTTP запрос | `requests`"""
+def _import_requests():
   try:
     import requests
   except ImportError as err:
@@ -348,6 +385,100 @@ def sync_request(method: str, url: str, *, ignore_status: bool = False, session=
       from pip._vendor import requests
     except ImportError:
       raise err
+  import requests.adapters
+  return requests
+
+
+class HTTPPool:
+  """Общие HTTP соединения процесса | `requests`.
+  Для каждого источника (схема, хост, порт) создаётся свой `HTTPAdapter` с пулом соединений, поэтому повторные запросы не открывают новое соединение и не повторяют TLS рукопожатие.
+  `sync_request` без `session` использует сессии отсюда (без кук), клиенты `ms.api` подключают пул к своим сессиям через `mount`, сохраняя свои заголовки и куки.
+  `pool_maxsize` - макс. кол-во сохраняемых соединений с одним источником, `max_retries` - кол-во повторов или `urllib3.util.Retry`"""
+
+  def __init__(self, pool_maxsize: int = 10, max_retries=0):
+    import threading
+    self._adapters: dict[tuple[str, str, int | None], typing.Any] = {}
+    self._lock = threading.RLock()
+    self._router = None
+    self._sessions: dict[tuple[str, str, int | None], typing.Any] = {}
+    self.max_retries = max_retries
+    self.pool_maxsize = pool_maxsize
+
+  @staticmethod
+  def origin(url: str) -> tuple[str, str, int | None]:
+    """Источник URL: схема, хост и порт"""
+    from urllib.parse import urlsplit
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    return scheme, (parts.hostname or "").lower(), parts.port or {"http": 80, "https": 443}.get(scheme)
+
+  def configure(self, *, pool_maxsize: int = None, max_retries=None):
+    """Изменить настройки. Открытые соединения закрываются, настройки применяются к новым соединениям"""
+    with self._lock:
+      self.close_all()
+      if pool_maxsize is not None:
+        self.pool_maxsize = pool_maxsize
+      if max_retries is not None:
+        self.max_retries = max_retries
+
+  def adapter(self, url: str):
+    """`HTTPAdapter` источника `url`"""
+    key = self.origin(url)
+    with self._lock:
+      if not key in self._adapters:
+        requests = _import_requests()
+        # Несколько пулов на случай разных настроек TLS (verify, cert) для одного источника
+        self._adapters[key] = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=self.max_retries)
+      return self._adapters[key]
+
+  def mount(self, session):
+    """Подключить пул к сессии `requests`: её запросы по HTTP(S) пойдут через общие соединения. `session.close()` их не закрывает"""
+    with self._lock:
+      if self._router is None:
+        requests = _import_requests()
+        pool = self
+
+        class PoolAdapter(requests.adapters.BaseAdapter):
+          def send(self, request, **kw):
+            return pool.adapter(request.url).send(request, **kw)
+
+          def close(self):
+            pass  # Соединения закрывает `close_all`
+        self._router = PoolAdapter()
+    session.mount("http://", self._router)
+    session.mount("https://", self._router)
+    return session
+
+  def session(self, url: str):
+    """Общая сессия без кук для источника `url`"""
+    key = self.origin(url)
+    with self._lock:
+      if not key in self._sessions:
+        from http.cookiejar import DefaultCookiePolicy
+        session = _import_requests().Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))  # Куки одного вызова не должны попасть в другой
+        self._sessions[key] = self.mount(session)
+      return self._sessions[key]
+
+  def close_all(self):
+    """Закрыть все соединения и сессии пула. Пул можно использовать дальше, соединения откроются заново"""
+    with self._lock:
+      adapters = list(self._adapters.values())
+      sessions = list(self._sessions.values())
+      self._adapters.clear()
+      self._sessions.clear()
+    for i in sessions:
+      i.close()
+    for i in adapters:
+      i.close()
+
+
+http_pool = HTTPPool()
+
+
+def sync_request(method: str, url: str, *, ignore_status: bool = False, session=None, **kw):
+  """Синхронный HTTP запрос | `requests`. Без `session` используется общая сессия из `http_pool`"""
+  requests = _import_requests()
   resp = None
   if isinstance(method, requests.Response):
     resp = method
@@ -357,7 +488,7 @@ def sync_request(method: str, url: str, *, ignore_status: bool = False, session=
     resp = url
   if resp is None:
     if session is None:
-      session = requests.Session()
+      session = http_pool.session(url)
     kw["method"] = method
     kw["url"] = url
     resp = session.request(**kw)
@@ -1066,11 +1197,8 @@ def iter_caller_modules():
     del frame
 
 
-def parse_shaXsums_hex(lines: str | list[str]):
-  """Парсить файлы в формате `sha256sums.txt`"""
-  if isinstance(lines, str):
-    lines = lines.splitlines()
-  result: dict[str, str] = {}  # filename: hex value
+def iter_shaXsums_hex(lines: typing.Iterable[str]) -> typing.Iterator[tuple[str, str]]:
+  """Потоково парсить файлы в формате `sha256sums.txt`: пары (имя файла, хеш в HEX)"""
   for line in lines:
     line = line.strip()
     if not line or line.startswith('#'):
@@ -1078,7 +1206,14 @@ def parse_shaXsums_hex(lines: str | list[str]):
     parts = line.replace("  ", " ").split(None, 1)
     if len(parts) == 2:
       hex_value, filename = parts
-      result[filename] = hex_value.lower()
+      yield filename, hex_value.lower()
+
+
+def parse_shaXsums_hex(lines: str | list[str]):
+  """Парсить файлы в формате `sha256sums.txt`"""
+  if isinstance(lines, str):
+    lines = lines.splitlines()
+  result: dict[str, str] = dict(iter_shaXsums_hex(lines))  # filename: hex value
   return result
 
 
@@ -1106,6 +1241,76 @@ def guess_checksum_alg(digest_len: int):
   return result
 
 
+SHAXSUMS_PREFERRED_ALGS = ["sha256", "sha512", "sha1", "md5", "sha384", "sha224", "blake2b", "blake2s", "sha3_256", "sha3_512"]
+
+
+class ShaXsumsResult(typing.NamedTuple):
+  filename: str
+  status: str
+  """`ok`, `mismatch`, `missing` или `error`"""
+  expected: str
+  actual: str | None = None
+  """Хеш файла в HEX или текст ошибки"""
+
+
+def _shaXsums_alg(hex_len: int) -> str:
+  algs = guess_checksum_alg(hex_len // 2)
+  for i in SHAXSUMS_PREFERRED_ALGS:
+    if i in algs:
+      return i
+  if not algs:
+    raise ValueError("Unknown checksum length: %i" % hex_len)
+  return sorted(algs)[0]
+
+
+def verify_shaXsums(manifest: str | os.PathLike | typing.Iterable[str], root: str | os.PathLike = None, *, alg: str = None, cache=None, jobs: int = None) -> typing.Iterator[ShaXsumsResult]:
+  """Проверить файлы по списку в формате `sha256sums.txt` в `jobs` потоках (по умолчанию кол-во ядер).
+  `manifest` - путь к списку или строки списка, `root` - папка, относительно которой указаны файлы (по умолчанию папка списка или текущая).
+  `alg` - алгоритм хеширования, по умолчанию определяется по длине хеша. `cache` - `ms.ms2hash.HashCache`, `None` - кэш по умолчанию, `False` - без кэша.
+  Список читается потоково, в обработке не больше `jobs * 2` файлов, результаты выдаются по мере готовности (не по порядку)"""
+  from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+  if jobs is None:
+    jobs = os.cpu_count() or 1
+  cache = ms.ms2hash.get_cache(cache)
+  with ExitStack() as stack:
+    if isinstance(manifest, (str, os.PathLike)):
+      if root is None:
+        root = os.path.dirname(os.path.abspath(manifest))
+      manifest = stack.enter_context(builtins.open(manifest, "r", encoding="utf-8"))
+    if root is None:
+      root = "."
+
+    def check(filename: str, expected: str) -> ShaXsumsResult:
+      path = os.path.join(root, filename[1:] if filename.startswith("*") else filename)  # * - бинарный режим
+      if not os.path.isfile(path):
+        return ShaXsumsResult(filename, "missing", expected)
+      try:
+        file_alg = alg or _shaXsums_alg(len(expected))
+        if cache is None:
+          actual = ms.ms2hash.hash_file(path, file_alg).hexdigest()
+        else:
+          actual = cache.hash_multi(path, [file_alg], lambda p, algs: {file_alg: ms.ms2hash.hash_file(p, file_alg).digest()})[file_alg].hex()
+      except Exception as err:
+        return ShaXsumsResult(filename, "error", expected, "%s: %s" % (type(err).__name__, err))
+      return ShaXsumsResult(filename, "ok" if actual == expected else "mismatch", expected, actual)
+    pool = stack.enter_context(ThreadPoolExecutor(jobs))
+    pending = set()
+    try:
+      for filename, expected in iter_shaXsums_hex(manifest):
+        if len(pending) >= jobs * 2:
+          done, pending = wait(pending, return_when=FIRST_COMPLETED)
+          for i in done:
+            yield i.result()
+        pending.add(pool.submit(check, filename, expected))
+      while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for i in done:
+          yield i.result()
+    finally:
+      for i in pending:
+        i.cancel()
+
+
 def int_size_unsigned(n: int):
   """Минимальное количество байт для неотрицательного `int`"""
   if n == 0:
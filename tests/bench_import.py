@@ -0,0 +1,60 @@
+"""Время `import MainShortcuts2` и проверка, что импорт не трогает файлы вне пакета и stdlib и не загружает профайлер запуска"""
+import json
+import os
+import subprocess
+import sys
+import time
+RUNS = 20
+CHILD_CODE = r"""
+import json, os, sys, threading, time
+opened = []
+def hook(event, args):
+  if event in ("open", "os.listdir", "os.scandir", "os.mkdir", "os.remove", "os.rename"):
+    if args and isinstance(args[0], (str, bytes)):
+      opened.append((event, os.fsdecode(args[0])))
+sys.addaudithook(hook)
+roots = [os.path.realpath(i) for i in sys.path if i]
+started = time.perf_counter()
+import MainShortcuts2
+elapsed = time.perf_counter() - started
+outside = []
+for event, path in opened:
+  real = os.path.realpath(path)
+  if not any(real == r or real.startswith(r + os.sep) for r in roots):
+    outside.append("%s %s" % (event, path))
+json.dump({"elapsed": elapsed, "outside": outside, "profiler": "MainShortcuts2._startup_profiler" in sys.modules, "threads": threading.active_count(), "modules": len(sys.modules)}, sys.stdout)
+"""
+
+
+def run_once():
+  env = os.environ.copy()
+  env.pop("MS2_NO_CONFIG", None)
+  env.pop("MS2_NO_UPDATE", None)
+  env.pop("MS2_PROFILE_STARTUP", None)
+  p = subprocess.run([sys.executable, "-c", CHILD_CODE], env=env, stdout=subprocess.PIPE, check=True)
+  return json.loads(p.stdout)
+
+
+def main():
+  results = [run_once() for _ in range(RUNS)]
+  times = sorted(i["elapsed"] for i in results)
+  outside = sorted({j for i in results for j in i["outside"]})
+  print("Runs: %i" % RUNS)
+  print("Import time: min %.2f ms, median %.2f ms" % (times[0] * 1000, times[len(times) // 2] * 1000))
+  print("Modules after import: %i" % results[0]["modules"])
+  print("Threads after import: %i" % results[0]["threads"])
+  assert not any(i["profiler"] for i in results), "MainShortcuts2._startup_profiler is imported by a plain import"
+  if outside:
+    print("FAIL: files touched outside the package/stdlib:")
+    for i in outside:
+      print("  " + i)
+    return 1
+  print("OK: no files touched outside the package/stdlib")
+  return 0
+
+
+if __name__ == "__main__":
+  started = time.perf_counter()
+  code = main()
+  print("Total: %.1f s" % (time.perf_counter() - started))
+  sys.exit(code)
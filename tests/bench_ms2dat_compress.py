@@ -0,0 +1,50 @@
+"""Степень сжатия и скорость сжатия/распаковки для каждого алгоритма MS2Dat"""
+import sys
+import time
+from MainShortcuts2 import ms
+M = ms.ms2dat_v1
+CODECS = [
+    ("zlib", M.MS2Dat1.COMPRESS_ZLIB, [1, 6, 9]),
+    ("bz2", M.MS2Dat1.COMPRESS_BZ2, [1, 9]),
+    ("lzma", M.MS2Dat1.COMPRESS_LZMA, [0, 6, None]),
+    ("zstd", ms.ms2dat_v2.MS2Dat2.COMPRESS_ZSTD, [1, 3, 9, 19]),
+    ("lz4", ms.ms2dat_v2.MS2Dat2.COMPRESS_LZ4, [0, 9]),
+]
+
+
+def make_data():
+  records = [{"id": i, "name": "user %i" % i, "score": i / 3, "tags": ["tag%i" % (i % 50), "group%i" % (i % 7)]} for i in range(50000)]
+  return bytes(M.Writer(M.MS2Dat1(), None, None).build_body(records, use_dict=False))
+
+
+def measure(func, *args, min_time=0.5):
+  runs = 0
+  started = time.perf_counter()
+  while True:
+    result = func(*args)
+    runs += 1
+    elapsed = time.perf_counter() - started
+    if elapsed >= min_time:
+      return result, elapsed / runs
+
+
+def main():
+  data = make_data()
+  size = len(data)
+  print("Raw body: %.1f MB" % (size / 2**20))
+  print("%-6s %6s %8s %14s %16s" % ("CODEC", "LEVEL", "RATIO", "COMPRESS, MB/s", "DECOMPRESS, MB/s"))
+  for name, compress_type, levels in CODECS:
+    for level in levels:
+      try:
+        (used, packed), t_compress = measure(M.compress_data, compress_type, data, level)
+      except ImportError as err:
+        print("%-6s skipped: %s" % (name, err))
+        break
+      assert used == compress_type
+      result, t_decompress = measure(M.decompress_data, compress_type, packed)
+      assert result == data
+      print("%-6s %6s %8.2f %14.1f %16.1f" % (name, "default" if level is None else level, size / len(packed), size / t_compress / 2**20, size / t_decompress / 2**20))
+
+
+if __name__ == "__main__":
+  sys.exit(main())
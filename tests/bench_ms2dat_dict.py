@@ -0,0 +1,28 @@
+"""Время сохранения MS2Dat со словарём в зависимости от количества уникальных строк"""
+import sys
+import time
+from MainShortcuts2 import ms
+SIZES = [1000, 10000, 100000, 1000000]
+
+
+def main():
+  inst = ms.ms2dat_v1.MS2Dat1()
+  inst.profile_fast()
+  inst.set_use_dict(True)
+  prev = None
+  print("%10s %10s %12s %8s" % ("STRINGS", "DUMP, s", "us/string", "ratio"))
+  for n in SIZES:
+    data = ["string number %i" % i for i in range(n)]
+    data += data[:n // 10]  # Повторы, чтобы словарь использовался
+    started = time.perf_counter()
+    buf = inst.dumps(data)
+    elapsed = time.perf_counter() - started
+    assert inst.loads(buf) == data
+    ratio = "" if prev is None else "%.1fx" % (elapsed / prev)
+    print("%10i %10.3f %12.3f %8s" % (n, elapsed, elapsed / n * 1e6, ratio))
+    prev = elapsed
+  # При линейной сложности время растёт примерно в 10 раз на каждую строку
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,38 @@
+"""Скорость сохранения и загрузки MS2Dat с шифрованием и без"""
+import os
+import sys
+import time
+from MainShortcuts2 import ms
+M = ms.ms2dat_v1
+
+
+def make_insts():
+  plain = M.MS2Dat1()
+  yield "none", plain
+  xor = M.MS2Dat1EncryptExample.create_with_random_key()
+  yield "xor", xor
+  for algorithm in M.MS2Dat1Cipher.ALGORITHMS:
+    yield algorithm, M.MS2Dat1Cipher.create_with_random_key(32, algorithm)
+
+
+def main():
+  data = [os.urandom(2**20) for _ in range(64)]
+  print("%-18s %10s %10s" % ("ENCRYPTION", "DUMP, s", "LOAD, s"))
+  for name, inst in make_insts():
+    inst.profile_fast()
+    inst.set_encrypt(name != "none")
+    try:
+      started = time.perf_counter()
+      buf = inst.dumps(data)
+    except ImportError as err:
+      print("%-18s skipped: %s" % (name, err))
+      continue
+    t_dump = time.perf_counter() - started
+    started = time.perf_counter()
+    assert inst.loads(buf) == data
+    t_load = time.perf_counter() - started
+    print("%-18s %10.3f %10.3f" % (name, t_dump, t_load))
+
+
+if __name__ == "__main__":
+  sys.exit(main())
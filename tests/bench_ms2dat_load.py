@@ -0,0 +1,63 @@
+"""Сравнение загрузки MS2Dat v1: по объектам из IO (`Reader.decode_obj`, как старый путь через `BytesIO`) и всего тела по `memoryview`"""
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from MainShortcuts2 import ms
+M = ms.ms2dat_v1
+
+
+def make_records(n: int):
+  return [{"id": i, "name": "user %i" % i, "score": i / 3, "blob": bytes(200) + i.to_bytes(4, "big")} for i in range(n)]
+
+
+def make_blobs(n: int):
+  return [i.to_bytes(4, "big") * 2**18 for i in range(n)]
+
+
+def load_bytesio(inst: M.MS2Dat1, data: bytes):
+  f = BytesIO(data)
+  M.FileHeader.from_file(f)
+  reader = M.Reader(inst, f)
+  raw_body = M.decompress_data(reader.compress_type, reader._read(reader.body_size))
+  with BytesIO(raw_body) as buf:
+    d = []
+    for i in range(int.from_bytes(buf.read(3), "big")):
+      d.append(reader.decode_obj(buf, d))
+    return reader.decode_obj(buf, d)
+
+
+def measure(func, *args):
+  # Время и память замеряются раздельно, tracemalloc сильно замедляет работу
+  started = time.perf_counter()
+  result = func(*args)
+  elapsed = time.perf_counter() - started
+  del result
+  tracemalloc.start()
+  result = func(*args)
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return result, elapsed, peak
+
+
+def bench(name: str, inst: M.MS2Dat1, data: bytes):
+  print("%s: %.1f MB" % (name, len(data) / 2**20))
+  expected, t_old, m_old = measure(load_bytesio, inst, data)
+  result, t_new, m_new = measure(inst.loads, data)
+  assert result == expected
+  _, t_view, m_view = measure(lambda: inst.loads(data, memoryview_bytes=True))
+  print("  %-24s %8s %10s" % ("DECODER", "TIME, s", "PEAK, MB"))
+  print("  %-24s %8.3f %10.1f" % ("decode_obj (BytesIO)", t_old, m_old / 2**20))
+  print("  %-24s %8.3f %10.1f" % ("decode_body (memoryview)", t_new, m_new / 2**20))
+  print("  %-24s %8.3f %10.1f" % ("memoryview (bytes=view)", t_view, m_view / 2**20))
+
+
+def main():
+  inst = M.MS2Dat1()
+  inst.profile_fastest()
+  bench("100k records", inst, inst.dumps(make_records(100000)))
+  bench("256 blobs x 1 MB", inst, inst.dumps(make_blobs(256)))
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,87 @@
+"""`CancelError` из обработчика прерывает скачивание в `FileDownloader` и `AsyncFileDownloader`. Сервер - локальный `http.server`"""
+import asyncio
+import http.server
+import os
+import tempfile
+import threading
+from MainShortcuts2 import ms
+
+PAYLOAD = os.urandom(4 * 2**20)
+stats = {"sent": 0}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+  def do_GET(self):
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(PAYLOAD)))
+    self.end_headers()
+    try:
+      for i in range(0, len(PAYLOAD), 2**16):
+        self.wfile.write(PAYLOAD[i:i + 2**16])
+        stats["sent"] += 2**16
+    except OSError:
+      pass
+
+  def log_message(self, *a):
+    pass
+
+
+def check_events(dl) -> list:
+  events = []
+  for event in (dl.EVENT_ERROR, dl.EVENT_END, dl.EVENT_COMPLETE):
+    dl.add_handler(event)(lambda event, **kw: events.append(event))
+  return events
+
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = "http://127.0.0.1:%i/file" % server.server_address[1]
+with tempfile.TemporaryDirectory() as tmp:
+  path = os.path.join(tmp, "file")
+  # FileDownloader: ограничение размера по событию EVENT_DOWNLOADING
+  dl = ms.advanced.FileDownloader()
+  dl.h_limit_size(2**20)
+  events = check_events(dl)
+  try:
+    dl.download2file(url, path)
+  except dl.CancelError:
+    pass
+  else:
+    raise AssertionError("Download was not canceled")
+  assert events == [dl.EVENT_ERROR, dl.EVENT_END], events
+  assert not os.path.exists(path)
+  # FileDownloader: отмена из EVENT_CHUNK
+  dl = ms.advanced.FileDownloader()
+  chunks = []
+
+  @dl.add_handler(dl.EVENT_CHUNK)
+  def cancel(chunk: bytes, **kw):
+    chunks.append(chunk)
+    if len(chunks) == 3:
+      raise dl.CancelError()
+  try:
+    dl.download2null(url)
+  except dl.CancelError:
+    pass
+  else:
+    raise AssertionError("Download was not canceled")
+  assert len(chunks) == 3
+
+  # AsyncFileDownloader: те же обработчики
+  async def main():
+    async with ms.advanced.AsyncFileDownloader() as dl:
+      dl.h_limit_size(2**20)
+      events = check_events(dl)
+      try:
+        await dl.download2file(url, path)
+      except dl.CancelError:
+        pass
+      else:
+        raise AssertionError("Async download was not canceled")
+      assert events == [dl.EVENT_ERROR, dl.EVENT_END], events
+      assert not os.path.exists(path) and not os.path.exists(path + ".ms2downloading")
+      results = [i async for i in dl.download_many([(url, path)])]
+      assert results[0]["errored"] and isinstance(results[0]["exception"], dl.CancelError)
+  asyncio.run(main())
+server.shutdown()
+print("OK")
@@ -0,0 +1,94 @@
+"""FileDownloader: скачивание частями в несколько соединений, продолжение после отмены и остановка после ошибки. Сервер - локальный `http.server` с поддержкой `Range`"""
+import hashlib
+import http.server
+import os
+import re
+import tempfile
+import threading
+import time
+import requests
+from MainShortcuts2 import ms
+
+PAYLOAD = os.urandom(8 * 2**20)
+stats = {"requests": 0, "sent": 0}
+settings = {"fail_start": None, "delay": 0.0}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+  def do_GET(self):
+    stats["requests"] += 1
+    start, end = 0, len(PAYLOAD) - 1
+    m = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+    if m:
+      start = int(m.group(1))
+      end = min(int(m.group(2) or end), end)
+      if start == settings["fail_start"]:
+        self.send_error(500)
+        return
+      time.sleep(settings["delay"])
+      self.send_response(206)
+      self.send_header("Content-Range", "bytes %i-%i/%i" % (start, end, len(PAYLOAD)))
+    else:
+      self.send_response(200)
+    self.send_header("Content-Length", str(end - start + 1))
+    self.send_header("ETag", '"v1"')
+    self.end_headers()
+    for i in range(start, end + 1, 2**16):
+      part = PAYLOAD[i:min(i + 2**16, end + 1)]
+      self.wfile.write(part)
+      stats["sent"] += len(part)
+
+  def log_message(self, *a):
+    pass
+
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = "http://127.0.0.1:%i/file" % server.server_address[1]
+with tempfile.TemporaryDirectory() as tmp:
+  path = os.path.join(tmp, "file")
+  checkpoint = path + ms.advanced.FileDownloader.CHECKPOINT_SUFFIX
+  # Обычное скачивание частями. Сессия вызывающего не меняется
+  session = requests.Session()
+  adapters = dict(session.adapters)
+  dl = ms.advanced.FileDownloader(session=session)
+  dl.h_hash("sha256")
+  data = dl.download2file(url, path, connections=4)
+  assert open(path, "rb").read() == PAYLOAD
+  assert session.adapters == adapters
+  assert data["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+  assert stats["requests"] > 2 and not os.path.exists(checkpoint)
+  os.remove(path)
+  # Отмена на середине и продолжение
+  dl = ms.advanced.FileDownloader()
+
+  @dl.add_handler(dl.EVENT_DOWNLOADING)
+  def cancel(downloaded: int, **kw):
+    if downloaded > len(PAYLOAD) // 2:
+      raise dl.CancelError()
+  try:
+    dl.download2file(url, path, connections=2)
+  except dl.CancelError:
+    pass
+  else:
+    raise AssertionError("Download was not canceled")
+  assert os.path.exists(checkpoint)
+  dl.handlers.clear()
+  stats["sent"] = 0
+  dl.download2file(url, path, connections=2, resume=True)
+  assert open(path, "rb").read() == PAYLOAD
+  assert stats["sent"] < len(PAYLOAD), "Resume downloaded the whole file again"
+  os.remove(path)
+  # После ошибки одной части остальные не запрашиваются
+  settings.update(fail_start=2**20, delay=0.2)
+  stats["requests"] = 0
+  try:
+    ms.advanced.FileDownloader().download2file(url, path, connections=2)
+  except Exception:
+    pass
+  else:
+    raise AssertionError("Error was not raised")
+  time.sleep(0.5)
+  assert stats["requests"] < 6, stats  # Проверка + первые части, из 8
+server.shutdown()
+print("OK")
@@ -0,0 +1,44 @@
+"""`HashCache.hash_many`: hasher, возвращающий нормализованные пути, и отсутствующие файлы"""
+import hashlib
+import os
+import tempfile
+from MainShortcuts2 import ms
+
+
+def hasher(paths: list[str], algs: set[str]) -> dict[str, dict[str, bytes]]:
+  """Как внешний хешер: ключи - абсолютные пути, отсутствующий файл - ошибка самого хешера"""
+  calls.append(list(paths))
+  result = {}
+  for path in paths:
+    if not os.path.exists(path):
+      raise FileNotFoundError("hasher: " + path)
+    with open(path, "rb") as f:
+      data = f.read()
+    result[os.path.realpath(path)] = {i: hashlib.new(i, data).digest() for i in algs}
+  return result
+
+
+calls = []
+with tempfile.TemporaryDirectory() as tmp:
+  cwd = os.getcwd()
+  os.chdir(tmp)
+  try:
+    for name in ("a", "b"):
+      with open(name, "wb") as f:
+        f.write(name.encode() * 1000)
+    with ms.ms2hash.HashCache(os.path.join(tmp, "cache.db")) as cache:
+      first = cache.hash_many(["a", "b"], ["sha256"], hasher)
+      assert set(first) == {"a", "b"}, first
+      assert first["a"]["sha256"] == hashlib.sha256(b"a" * 1000).digest()
+      second = cache.hash_many(["a", "b"], ["sha256"], hasher)
+      assert second == first and len(calls) == 1 and cache.hits == 2
+      try:
+        cache.hash_many(["a", "missing"], ["sha256"], hasher)
+      except FileNotFoundError as err:
+        assert str(err).startswith("hasher: "), err
+      else:
+        raise AssertionError("Missing file was not reported")
+      assert calls[-1] == ["missing"]
+  finally:
+    os.chdir(cwd)
+print("OK")
@@ -0,0 +1,22 @@
+"""RecordLog: недописанная запись в конце файла (сбой во время записи) не мешает дописывать и читать журнал"""
+import os
+import tempfile
+from MainShortcuts2.ms2dat_log import RecordLog
+
+with tempfile.TemporaryDirectory() as tmp:
+  path = os.path.join(tmp, "log.ms2l")
+  with RecordLog(path) as log:
+    log.append({"n": 1})
+    end = log.append({"n": 2, "data": "x" * 1000})
+  # Обрезать последнюю запись посередине
+  with open(path, "r+b") as f:
+    f.truncate(end - 500)
+  assert list(RecordLog(path)) == [{"n": 1}]
+  with RecordLog(path) as log:
+    log.append({"n": 3})
+  assert list(RecordLog(path)) == [{"n": 1}, {"n": 3}], list(RecordLog(path))
+  # Испорченный размер в заголовке не должен приводить к чтению огромного блока
+  with open(path, "ab") as f:
+    f.write(bytes([0, 0x10]) + (2**60).to_bytes(8, "big"))
+  assert list(RecordLog(path)) == [{"n": 1}, {"n": 3}]
+print("OK")
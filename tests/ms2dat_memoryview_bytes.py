@@ -0,0 +1,16 @@
+"""MS2Dat: данные, загруженные с `memoryview_bytes`, после повторной записи остаются `bytes`, а числовые `memoryview` - массивами"""
+import array
+from MainShortcuts2 import ms
+
+for inst in ms.ms2dat_v1.MS2Dat1(), ms.ms2dat_v2.MS2Dat2():
+  data = {"blob": b"\x00\x01" * 100, "list": [b"abc", b""], "text": "x"}
+  inst.set_memoryview_bytes(True)
+  loaded = inst.loads(inst.dumps(data))
+  assert isinstance(loaded["blob"], memoryview)
+  inst.set_memoryview_bytes(False)
+  again = inst.loads(inst.dumps(loaded))
+  assert again == data, again
+  assert type(again["blob"]) is bytes
+  arr = array.array("i", range(10))
+  assert inst.loads(inst.dumps(memoryview(arr))) == arr
+print("OK")
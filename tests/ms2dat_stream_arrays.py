@@ -0,0 +1,33 @@
+"""MS2Dat v1: встроенные типы массивов объявляются в заголовке потокового режима, только если массивы есть в объекте. Многомерный `memoryview` не пишется плоским массивом"""
+import array
+import io
+from MainShortcuts2 import ms
+
+inst = ms.ms2dat_v1.MS2Dat1()
+inst.set_stream(True)
+
+
+def dumps(obj) -> bytes:
+  with io.BytesIO() as f:
+    inst.dump(obj, f)
+    return f.getvalue()
+
+
+data = {"list": [1, 2.5, "x", b"y"], "view": memoryview(b"bytes")}
+raw = dumps(data)
+assert b"ms2.array" not in raw and b"ms2.ndarray" not in raw
+assert inst.loads(raw) == {"list": [1, 2.5, "x", b"y"], "view": b"bytes"}
+arr = array.array("d", [1.5, 2.5])
+raw = dumps({"nested": [(1, {"arr": arr})]})
+assert b"ms2.array" in raw and b"ms2.ndarray" not in raw
+assert inst.loads(raw) == {"nested": [(1, {"arr": arr})]}
+view2d = memoryview(array.array("i", range(6))).cast("B").cast("i", (2, 3))
+for stream in True, False:
+  inst.set_stream(stream)
+  try:
+    inst.dumps(view2d)
+  except ValueError:
+    pass
+  else:
+    raise AssertionError("2-D memoryview was written as a flat array")
+print("OK")